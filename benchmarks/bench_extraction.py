@@ -0,0 +1,101 @@
+"""Compare the old prettify() prompt with the extracted page text prompt
+
+Usage:
+    python benchmarks/bench_extraction.py [page.html ...] [--repeat N] [--live]
+
+Without files a synthetic article page (scripts, styles, nav chrome and a
+long body) is used. --live additionally sends both prompts to the LLM once
+each and reports the round trip latency, which needs OPENAI_API_KEY.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('OPENAI_API_KEY', 'sk-bench')
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import main  # noqa: E402
+
+
+VOCABULARY = "python, machine learning, pytorch, kubernetes, rust, react, aws, transformers"
+
+
+def synthetic_page(paragraphs=400):
+    script = "<script>" + "var x = function(){return 1;};" * 200 + "</script>"
+    style = "<style>" + ".a{color:red;margin:0 auto;}" * 200 + "</style>"
+    nav = "<nav><ul>" + "".join(f"<li><a href='/p{i}'>Link {i}</a></li>" for i in range(150)) + "</ul></nav>"
+    body = "".join(
+        f"<h2>Section {i}</h2><p>Training transformers with PyTorch on Kubernetes clusters, "
+        f"paragraph {i} with some filler text about machine learning systems.</p>"
+        for i in range(paragraphs)
+    )
+    return (
+        "<html><head><title>Scaling Transformers</title>"
+        "<meta name='description' content='Notes on distributed training'>"
+        f"{script}{style}</head><body>{nav}<main><article>{body}</article></main>"
+        "<footer>Copyright</footer></body></html>"
+    )
+
+
+def time_call(func, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(samples)
+
+
+async def llm_latency(page_text):
+    start = time.perf_counter()
+    await main.ResourceAnalyzer.client.responses.create(
+        model="gpt-5-mini",
+        input=main.ResourceAnalyzer.web_prompt(page_text, VOCABULARY),
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+def report(name, html, repeat, live):
+    before, before_ms = time_call(lambda: BeautifulSoup(html, "html.parser").prettify(), repeat)
+    after, after_ms = time_call(lambda: main.extract_page_text(html), repeat)
+
+    before_tokens = main.estimate_tokens(before)
+    after_tokens = main.estimate_tokens(after)
+    print(f"{name}: {len(html):,} bytes of HTML")
+    print(f"  prettify   {len(before):>10,} chars  ~{before_tokens:>8,} tokens  {before_ms:8.1f} ms parse")
+    print(f"  extracted  {len(after):>10,} chars  ~{after_tokens:>8,} tokens  {after_ms:8.1f} ms parse")
+    print(f"  prompt reduced {before_tokens / max(after_tokens, 1):.1f}x")
+
+    if live:
+        before_llm = asyncio.run(llm_latency(before))
+        after_llm = asyncio.run(llm_latency(after))
+        print(f"  llm round trip  prettify {before_llm:.0f} ms  extracted {after_llm:.0f} ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--live', action='store_true')
+    args = parser.parse_args()
+
+    parser_name = main.html_backend()[0]
+    print(f"extraction parser: {parser_name}, MAX_DOCUMENT_TOKENS={main.Config.MAX_DOCUMENT_TOKENS}")
+
+    if not args.files:
+        report("synthetic", synthetic_page(), args.repeat, args.live)
+    for path in args.files:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            report(path, f.read(), args.repeat, args.live)
+
+
+if __name__ == "__main__":
+    main_cli()
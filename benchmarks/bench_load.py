@@ -0,0 +1,284 @@
+"""Offline load test of ResourceBot.check_for_resources
+
+Usage:
+    python benchmarks/bench_load.py [--users 100,10000,100000] [--messages N]
+        [--concurrency N] [--llm-latency-ms MS] [--attachment-ratio R]
+
+Nothing leaves the machine: messages, guilds, members and attachments are
+fakes, pages come from a local aiohttp server, the OpenAI client is a stub
+that sleeps --llm-latency-ms and answers from the vocabulary, and every run
+uses a fresh temp SQLite DB. Each guild size reports messages/sec, p50/p99
+end-to-end latency, peak RSS and event-loop lag.
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('OPENAI_API_KEY', 'sk-bench')
+os.environ.setdefault('METRICS_PORT', '0')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from aiohttp import web  # noqa: E402
+
+import main  # noqa: E402
+
+
+SKILLS = [
+    "python", "machine learning", "pytorch", "kubernetes", "rust", "react", "typescript",
+    "deep learning", "computer vision", "postgresql", "docker", "distributed systems",
+    "data engineering", "natural language processing", "reinforcement learning", "go",
+]
+INTERESTS = ["open source", "research", "startups", "compilers", "robotics", "security", "mlops"]
+
+# Exact hits never reach the LLM, the stem/synonym ones do, the rest is skipped
+PAGE_BODIES = {
+    'exact': "A practical guide to machine learning with python and pytorch on kubernetes.",
+    'ambiguous': "Notes on training llm and dl models, plus some k8s tips for deployments.",
+    'irrelevant': "A recipe for sourdough bread with a long fermentation and a crisp crust.",
+}
+
+
+# Fake Discord objects
+class FakeMember:
+    __slots__ = ('id', 'mention')
+
+    def __init__(self, member_id):
+        self.id = member_id
+        self.mention = f"<@{member_id}>"
+
+
+class FakeGuild:
+    def __init__(self, guild_id, member_ids):
+        self.id = guild_id
+        self.members = {member_id: FakeMember(member_id) for member_id in member_ids}
+        self.chunked = True
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+
+class FakeAttachment:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.size = len(data)
+        self._data = data
+
+    async def read(self):
+        return self._data
+
+
+class FakeMessage:
+    def __init__(self, message_id, guild, content, attachments=()):
+        self.id = message_id
+        self.guild = guild
+        self.channel = SimpleNamespace(id=1)
+        self.author = SimpleNamespace(id=0, bot=False)
+        self.content = content
+        self.attachments = list(attachments)
+        self.replies = []
+
+    async def reply(self, embed=None, embeds=None, **kwargs):
+        self.replies.append(embeds or [embed])
+
+
+# Stub OpenAI
+class StubOpenAI:
+    """Answers like the API would, after a configurable delay"""
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.responses = SimpleNamespace(create=self.create, parse=self.parse)
+        self.embeddings = SimpleNamespace(create=self.embed)
+
+    @staticmethod
+    def _user_content(kwargs):
+        return kwargs['input'][-1]['content'].lower()
+
+    @staticmethod
+    def _usage(kwargs):
+        return SimpleNamespace(input_tokens=main.estimate_tokens(str(kwargs['input'])), output_tokens=16)
+
+    @staticmethod
+    def _keywords(text):
+        expanded = " ".join(main.SKILL_SYNONYMS.get(word, word) for word in text.split())
+        return [skill for skill in SKILLS if skill in expanded]
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        text = self._user_content(kwargs).split("here is the")[0]
+        return SimpleNamespace(output_text=", ".join(self._keywords(text)), usage=self._usage(kwargs))
+
+    async def parse(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        sections = self._user_content(kwargs).split("### resource ")[1:]
+        results = [
+            main.IndexedKeyword(resource_index=index, keyword_list=self._keywords(section))
+            for index, section in enumerate(sections)
+        ]
+        return SimpleNamespace(output_parsed=main.KeywordBatch(results=results), usage=self._usage(kwargs))
+
+    async def embed(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        vectors = await main.LocalEmbedder().embed(kwargs['input'])
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=vector.tolist()) for vector in vectors],
+            usage=SimpleNamespace(prompt_tokens=16),
+        )
+
+
+# Local page server
+async def handle_page(request):
+    kind = request.match_info['kind']
+    page_id = request.match_info['page_id']
+    filler = "".join(f"<p>Paragraph {i} of page {page_id}. {PAGE_BODIES[kind]}</p>" for i in range(40))
+    html = (
+        f"<html><head><title>Page {page_id}</title><script>var x = 1;</script></head>"
+        f"<body><nav>Home | About</nav><article><h1>{kind} {page_id}</h1>{filler}</article></body></html>"
+    )
+    return web.Response(text=html, content_type='text/html')
+
+
+async def start_page_server():
+    app = web.Application()
+    app.router.add_get('/{kind}/{page_id}', handle_page)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def populate(db_manager, guild_id, users, rng):
+    """bulk insert synthetic profiles, far faster than save_user one by one"""
+    rows = []
+    for discord_id in range(1, users + 1):
+        skills = ", ".join(rng.sample(SKILLS, 3))
+        interests = ", ".join(rng.sample(INTERESTS, 2))
+        rows.append((discord_id, f"user{discord_id}", guild_id, "engineer", skills, interests))
+    with db_manager.get_connection() as conn:
+        conn.executemany(
+            'INSERT INTO users (discord_id, discord_username, server_id, job_title, skills, interests) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            rows
+        )
+        db_manager._rebuild_vocabulary(conn, [guild_id])
+        conn.commit()
+
+
+def make_messages(guild, base_url, count, attachment_ratio, rng):
+    messages = []
+    for message_id in range(count):
+        # A small page pool, so reposts exercise the result cache too
+        kind = rng.choice(list(PAGE_BODIES))
+        url = f"{base_url}/{kind}/{rng.randrange(count // 4 + 1)}"
+        attachments = []
+        if rng.random() < attachment_ratio:
+            body = PAGE_BODIES[rng.choice(list(PAGE_BODIES))] * 50
+            attachments.append(FakeAttachment(f"notes{message_id}.txt", f"{message_id}\n{body}".encode()))
+        messages.append(FakeMessage(message_id, guild, f"have a look at {url} !", attachments))
+    return messages
+
+
+async def monitor_loop_lag(samples, interval=0.01):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+async def run_scenario(users, args, base_url):
+    rng = random.Random(users)
+    main.Config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), f'bench-{users}.db')
+    bot = main.ResourceBot()
+    stub = StubOpenAI(args.llm_latency_ms / 1000)
+    main.ResourceAnalyzer.client.client = stub
+
+    guild_id = 1000 + users
+    populate(bot.db_manager, guild_id, users, rng)
+    guild = FakeGuild(guild_id, range(1, users + 1))
+    messages = make_messages(guild, base_url, args.messages, args.attachment_ratio, rng)
+    await bot.analyzer.start()
+    # Spawning the document workers is a one-off, keep it out of the numbers
+    await bot.analyzer.extract_text_from_document(FakeAttachment("warmup.txt", b"warm up"))
+
+    latencies = []
+    lag = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def drive(message):
+        async with semaphore:
+            start = time.perf_counter()
+            await bot.check_for_resources(message)
+            latencies.append(time.perf_counter() - start)
+
+    monitor = asyncio.create_task(monitor_loop_lag(lag))
+    started = time.perf_counter()
+    await asyncio.gather(*(drive(message) for message in messages))
+    elapsed = time.perf_counter() - started
+    monitor.cancel()
+
+    replies = sum(len(message.replies) for message in messages)
+    cache = bot.analyzer.cache
+    print(
+        f"{users:>7,} users  {len(messages) / elapsed:8.1f} msg/s  "
+        f"p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  p99 {percentile(latencies, 0.99) * 1000:7.1f} ms  "
+        f"loop lag p99 {percentile(lag, 0.99) * 1000:6.1f} ms max {max(lag, default=0) * 1000:6.1f} ms  "
+        f"rss {peak_rss_mb():7.1f} MB  llm calls {stub.calls:5}  cache hits {cache.hits:5}  replies {replies}"
+    )
+
+    await bot.analyzer.close()
+    bot.db_manager.close()
+    return statistics.mean(latencies) if latencies else 0.0
+
+
+async def run(args):
+    runner, base_url = await start_page_server()
+    print(
+        f"{args.messages} messages, concurrency {args.concurrency}, llm latency {args.llm_latency_ms} ms, "
+        f"match mode {main.Config.MATCH_MODE}, batching {main.Config.LLM_BATCHING}"
+    )
+    try:
+        for users in args.users:
+            await run_scenario(users, args, base_url)
+    finally:
+        await runner.cleanup()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=lambda value: [int(part) for part in value.split(',')],
+                        default=[100, 1000, 10000, 100000])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--llm-latency-ms', type=float, default=200)
+    parser.add_argument('--attachment-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,106 @@
+"""Memory and startup cost of the full member cache vs. MEMBER_CACHE=lean
+
+Usage:
+    python benchmarks/bench_members.py [--members 10000,100000,500000] [--registered 0.02]
+
+Offline stand-in for a gateway connection: member payloads shaped like
+GUILD_MEMBERS_CHUNK events are turned into discord.Member objects and added
+to a real discord.Guild, which is what chunking does for every guild at
+startup in the full mode. Lean mode never chunks and only remembers the
+registered members that were tagged, as ids in the renderer's LRU. Startup
+time here is the CPU cost of processing the chunks; the real one also waits
+on the gateway for every 1000 members.
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('OPENAI_API_KEY', 'sk-bench')
+os.environ.setdefault('METRICS_PORT', '0')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import discord  # noqa: E402
+
+import main  # noqa: E402
+
+
+CHUNK_SIZE = 1000
+GUILD_ID = 1 << 40
+
+
+def guild_payload():
+    return {
+        'id': str(GUILD_ID), 'name': 'bench', 'owner_id': '1', 'roles': [], 'emojis': [], 'stickers': [],
+        'features': [], 'member_count': 0, 'channels': [], 'threads': [], 'members': [], 'large': True,
+    }
+
+
+def member_payload(user_id):
+    return {
+        'user': {'id': str(user_id), 'username': f'user{user_id}', 'discriminator': '0', 'avatar': None,
+                 'global_name': f'User {user_id}'},
+        'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00', 'deaf': False, 'mute': False, 'flags': 0,
+    }
+
+
+def measure(func):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current / (1024 * 1024)
+
+
+def full_cache(state, members):
+    guild = discord.Guild(data=guild_payload(), state=state)
+    for start in range(1, members + 1, CHUNK_SIZE):
+        for user_id in range(start, min(start + CHUNK_SIZE, members + 1)):
+            guild._add_member(discord.Member(data=member_payload(user_id), guild=guild, state=state))
+    return guild
+
+
+def lean_cache(members, registered):
+    renderer = main.MentionRenderer(mode='lean')
+    # Registered users spread over the guild, each tagged at least once
+    step = max(1, int(1 / registered))
+    for user_id in range(1, members + 1, step):
+        renderer.remember(GUILD_ID, user_id, True)
+    return renderer
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=lambda value: [int(part) for part in value.split(',')],
+                        default=[10000, 100000, 500000])
+    parser.add_argument('--registered', type=float, default=0.02,
+                        help="share of the guild with a profile")
+    args = parser.parse_args()
+
+    intents = discord.Intents.default()
+    intents.members = True
+    client = discord.Client(intents=intents)
+    state = client._connection
+
+    print(f"registered share {args.registered:.0%}, LRU size {main.Config.MEMBER_LRU_SIZE}")
+    for members in args.members:
+        guild, full_seconds, full_mb = measure(lambda: full_cache(state, members))
+        assert len(guild.members) == members
+        del guild
+        _, lean_seconds, lean_mb = measure(lambda: lean_cache(members, args.registered))
+        print(
+            f"{members:>8,} members  full: {full_mb:8.1f} MB {full_seconds:6.2f}s "
+            f"({(members + CHUNK_SIZE - 1) // CHUNK_SIZE} chunks)   lean: {lean_mb:6.2f} MB {lean_seconds:6.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,94 @@
+"""Cold start cost of a bot process: import time and the command tree check
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5]
+
+Every run is a fresh interpreter, like a restarted shard worker. It reports
+the median `import main` time, which of the heavy optional modules got
+imported with it (they should all be deferred to first use), what each of
+those would have added on its own, and the cost of hashing the command tree
+and looking the stored hash up, which is all a restart with unchanged
+commands does instead of tree.sync().
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['openai', 'bs4', 'lxml', 'selectolax', 'PyPDF2', 'docx', 'numpy', 'requests']
+
+IMPORT_MAIN = f"""
+import json, sys, time
+sys.path.insert(0, {ROOT!r})
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+
+IMPORT_MODULE = """
+import json, sys, time
+started = time.perf_counter()
+try:
+    import {name}
+except ImportError:
+    print(json.dumps(None))
+else:
+    print(json.dumps(time.perf_counter() - started))
+"""
+
+TREE_CHECK = f"""
+import asyncio, json, sys, time
+sys.path.insert(0, {ROOT!r})
+import main
+bot = main.ResourceBot()
+bot._connection.application_id = 1
+async def check():
+    await bot.db_manager.set_meta('command_tree_hash', bot.command_tree_hash())
+    started = time.perf_counter()
+    unchanged = await bot.db_manager.get_meta('command_tree_hash') == bot.command_tree_hash()
+    return time.perf_counter() - started, unchanged
+seconds, unchanged = asyncio.run(check())
+print(json.dumps({{'seconds': seconds, 'unchanged': unchanged, 'commands': len(bot.tree.get_commands())}}))
+"""
+
+
+def run_python(code):
+    env = dict(os.environ)
+    env.setdefault('OPENAI_API_KEY', 'sk-bench')
+    env['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    env['METRICS_PORT'] = '0'
+    env['LOG_LEVEL'] = 'WARNING'
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [run_python(IMPORT_MAIN) for _ in range(args.runs)]
+    seconds = statistics.median(run['seconds'] for run in runs)
+    loaded = runs[-1]['loaded']
+    print(f"import main: median {seconds * 1000:7.1f} ms over {args.runs} runs")
+    print(f"heavy modules imported eagerly: {', '.join(loaded) if loaded else 'none'}")
+
+    print("deferred until first use:")
+    for name in HEAVY_MODULES:
+        cost = run_python(IMPORT_MODULE.format(name=name))
+        print(f"  {name:<11} {'not installed' if cost is None else f'{cost * 1000:7.1f} ms'}")
+
+    check = run_python(TREE_CHECK)
+    print(
+        f"command tree check ({check['commands']} commands): {check['seconds'] * 1000:.2f} ms, "
+        f"{'unchanged, sync skipped' if check['unchanged'] else 'changed, would sync'}"
+    )
+
+
+if __name__ == "__main__":
+    main_cli()
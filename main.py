@@ -3,13 +3,12 @@ from discord import app_commands
 from discord.ext import commands
 import asyncio
 import aiohttp
-import openai
-import PyPDF2
-import docx
+from aiohttp import web
 import io
-from openai import AsyncOpenAI
 import os
 import json
+import csv
+import itertools
 import re
 from typing import Optional, List, Dict
 from datetime import datetime
@@ -17,17 +16,63 @@ import logging
 from pydantic import BaseModel
 from typing import List
 import sqlite3
+import threading
+import queue
+import functools
+import hashlib
+import random
+import zlib
+import time
+import contextvars
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from contextlib import contextmanager
+from types import SimpleNamespace
+from collections import OrderedDict, deque
 
-import requests
-from bs4 import BeautifulSoup
+# openai, bs4/selectolax, PyPDF2, docx and numpy are imported on first use,
+# so a (re)starting shard connects to the gateway without paying for them
+np = None  # set by load_numpy(), only needed for MATCH_MODE=embedding
+
+
+def load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+@functools.lru_cache(maxsize=None)
+def html_backend():
+    """(name, parse) of the HTML parser, selectolax if installed, else BeautifulSoup"""
+    try:
+        from selectolax.parser import HTMLParser
+        return 'selectolax', HTMLParser
+    except ImportError:
+        pass
+    from bs4 import BeautifulSoup
+    try:
+        import lxml  # noqa: F401
+        features = "lxml"
+    except ImportError:
+        features = "html.parser"
+    return f'bs4/{features}', functools.partial(BeautifulSoup, features=features)
+
+
+def make_openai_client():
+    from openai import AsyncOpenAI
+    # The gateway does the retrying, so the SDK's own retries are turned off
+    return AsyncOpenAI(api_key=api_key, max_retries=0)
 
 
 
 
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger('discord_bot')
 
 class Config:
@@ -35,38 +80,701 @@ class Config:
     DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     DATABASE_PATH = os.getenv('DATABASE_PATH', 'discord_bot.db')  # Add this
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 4))
     GROUP_THEME = os.getenv('GROUP_THEME', 'Technology and Programming')
+    CACHE_TTL_SECONDS = int(os.getenv('CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 50000))
+    CACHE_EVICT_EVERY = 100
     MAX_DOCUMENT_TOKENS = 1000
+    MAX_CONCURRENT_RESOURCES = int(os.getenv('MAX_CONCURRENT_RESOURCES', 16))
+    IMPORT_CHUNK_SIZE = 500  # stays under SQLite's 999 bound parameters
+    MAX_IMPORT_BYTES = int(os.getenv('MAX_IMPORT_BYTES', 20 * 1024 * 1024))
+    MAX_URLS_PER_MESSAGE = int(os.getenv('MAX_URLS_PER_MESSAGE', 10))
+    MAX_RESOURCES_PER_MESSAGE = int(os.getenv('MAX_RESOURCES_PER_MESSAGE', 4))
+    RESOURCE_TIMEOUT_SECONDS = float(os.getenv('RESOURCE_TIMEOUT_SECONDS', 60))
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 100))
+    HTTP_POOL_PER_HOST = int(os.getenv('HTTP_POOL_PER_HOST', 8))
+    HTTP_DNS_CACHE_SECONDS = int(os.getenv('HTTP_DNS_CACHE_SECONDS', 300))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+    HTTP_TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', 20))
+    MAX_PAGE_BYTES = int(os.getenv('MAX_PAGE_BYTES', 2 * 1024 * 1024))
+    DOCUMENT_WORKERS = int(os.getenv('DOCUMENT_WORKERS', 2))
+    DOCUMENT_TIMEOUT_SECONDS = float(os.getenv('DOCUMENT_TIMEOUT_SECONDS', 30))
+    MAX_ATTACHMENT_BYTES = int(os.getenv('MAX_ATTACHMENT_BYTES', 10 * 1024 * 1024))
+    MAX_DOCUMENT_PAGES = int(os.getenv('MAX_DOCUMENT_PAGES', 50))
+    MAX_DOCUMENT_CHARS = int(os.getenv('MAX_DOCUMENT_CHARS', 300000))
+    MATCHER_CACHE_SIZE = 256
+    MAX_DOCUMENT_TOTAL_TOKENS = int(os.getenv('MAX_DOCUMENT_TOTAL_TOKENS', 20000))
+    CHUNK_CONCURRENCY = int(os.getenv('CHUNK_CONCURRENCY', 4))
+    LLM_REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', 500))
+    LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', 200000))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 3))
+    LLM_RETRY_BASE_SECONDS = 0.5
+    LLM_RETRY_MAX_SECONDS = 8
+    LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', 5))
+    LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', 30))
+    LLM_BATCHING = os.getenv('LLM_BATCHING', 'true').lower() == 'true'
+    LLM_BATCH_WINDOW_MS = int(os.getenv('LLM_BATCH_WINDOW_MS', 200))
+    LLM_BATCH_MAX_SIZE = int(os.getenv('LLM_BATCH_MAX_SIZE', 8))
+    LLM_BATCH_MAX_TOKENS = int(os.getenv('LLM_BATCH_MAX_TOKENS', 16000))
+    MATCH_MODE = os.getenv('MATCH_MODE', 'keyword')  # or 'embedding'
+    EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'openai')  # or 'local'
+    EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+    EMBEDDING_TOP_K = int(os.getenv('EMBEDDING_TOP_K', 50))
+    # Hashed local vectors score much lower than real embeddings
+    EMBEDDING_THRESHOLD = float(os.getenv('EMBEDDING_THRESHOLD', 0.35 if EMBEDDING_BACKEND == 'openai' else 0.1))
+    EMBEDDING_BATCH_SIZE = 256
+    EMBEDDING_MAX_TOKENS = 2000
+    LOCAL_EMBEDDING_DIM = 256
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+    JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 1000))
+    JOB_QUEUE_POLICY = os.getenv('JOB_QUEUE_POLICY', 'drop_oldest')  # or 'reject'
+    PERSIST_JOBS = os.getenv('PERSIST_JOBS', 'false').lower() == 'true'
+    SHARD_PROCESSES = int(os.getenv('SHARD_PROCESSES', 1))
+    SHARD_COUNT = int(os.getenv('SHARD_COUNT', 0)) or None
+    SHARDED = os.getenv('SHARDED', 'false').lower() == 'true' or SHARD_PROCESSES > 1
+    # Crashed shard processes are restarted with exponential backoff, and given up on
+    # after SHARD_MAX_FAST_FAILURES crashes in a row within SHARD_FAST_FAILURE_SECONDS of starting
+    SHARD_RESTART_BASE_SECONDS = 5
+    SHARD_RESTART_MAX_SECONDS = 300
+    SHARD_FAST_FAILURE_SECONDS = 60
+    SHARD_MAX_FAST_FAILURES = int(os.getenv('SHARD_MAX_FAST_FAILURES', 5))
+    CHANGE_POLL_SECONDS = float(os.getenv('CHANGE_POLL_SECONDS', 2))
+    CHANGE_LOG_RETENTION_SECONDS = 3600
+    RESOURCE_HISTORY = os.getenv('RESOURCE_HISTORY', 'true').lower() == 'true'
+    RESOURCE_FLUSH_SIZE = int(os.getenv('RESOURCE_FLUSH_SIZE', 200))
+    RESOURCE_FLUSH_SECONDS = float(os.getenv('RESOURCE_FLUSH_SECONDS', 5))
+    RESOURCE_BUFFER_MAX = 10000
+    RESOURCE_RETENTION_DAYS = int(os.getenv('RESOURCE_RETENTION_DAYS', 90))
+    RESOURCE_COMPACT_DAYS = int(os.getenv('RESOURCE_COMPACT_DAYS', 7))
+    RESOURCE_MAINTENANCE_SECONDS = 3600
+    STATS_CACHE_SECONDS = float(os.getenv('STATS_CACHE_SECONDS', 60))
+    STATS_WINDOW_DAYS = 30
+    # Sync slash commands on every boot instead of only when their definitions change
+    FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', 'false').lower() == 'true'
+    MEMBER_CACHE = os.getenv('MEMBER_CACHE', 'full')  # or 'lean' / 'raw'
+    MEMBER_LRU_SIZE = int(os.getenv('MEMBER_LRU_SIZE', 10000))
+    MAX_MENTIONS = int(os.getenv('MAX_MENTIONS', 100))
+    MAX_MENTION_MESSAGES = int(os.getenv('MAX_MENTION_MESSAGES', 3))
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))  # 0 turns the endpoint off
 
 # Initialize OpenAI
 api_key = Config.OPENAI_API_KEY
 
+class ResourceFetchError(Exception):
+    """raised when a url can't be turned into analyzable content"""
+
+
 class Keyword(BaseModel):
     """output class for Openai calls"""
     keyword_list : List[str]
+
+
+class IndexedKeyword(Keyword):
+    """keywords of one resource in a batched call"""
+    resource_index : int
+
+
+class KeywordBatch(BaseModel):
+    """output class for batched Openai calls"""
+    results : List[IndexedKeyword]
     
 
-class DatabaseManager:
-    """Database class for all the sql files - SQLite version"""
+def normalize_term(term):
+    """lower-case a skill/interest term and collapse its whitespace"""
+    return " ".join(str(term).lower().split())
+
+
+def split_terms(*fields):
+    """split comma separated profile fields into a set of normalized terms"""
+    terms = set()
+    for field in fields:
+        if not field:
+            continue
+        for part in field.split(','):
+            term = normalize_term(part)
+            if term:
+                terms.add(term)
+    return terms
+
+
+CHARS_PER_TOKEN = 4
+PAGE_BOILERPLATE_TAGS = ('script', 'style', 'noscript', 'template', 'svg', 'iframe',
+                         'nav', 'header', 'footer', 'aside', 'form', 'button')
+
+
+def estimate_tokens(text):
+    """cheap token estimate, close enough to budget prompts"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    """cut text to roughly max_tokens, on a word boundary when possible"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars]
+
+
+def chunk_text(text, max_tokens):
+    """split text into ~max_tokens segments, breaking at paragraphs, lines or words"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + max_chars, length)
+        if end < length:
+            for separator in ("\n\n", "\n", " "):
+                cut = text.rfind(separator, start + max_chars // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end
+    return chunks
+
+
+def _collapse_lines(text):
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def extract_page_text(html, max_tokens=None):
+    """Turn an HTML page into compact text for the LLM
+
+    Keeps the title, meta description, headings and the main content text and
+    drops scripts, styles and navigation chrome. Uses selectolax when it is
+    installed, otherwise BeautifulSoup with lxml (or the stdlib parser).
+    """
+    max_tokens = max_tokens or Config.MAX_DOCUMENT_TOKENS
+
+    backend, parse = html_backend()
+    if backend == 'selectolax':
+        tree = parse(html)
+        title_node = tree.css_first('title')
+        title = title_node.text(strip=True) if title_node else ""
+        meta_node = tree.css_first('meta[name="description"]') or tree.css_first('meta[property="og:description"]')
+        description = (meta_node.attributes.get('content') or "") if meta_node else ""
+        tree.strip_tags(list(PAGE_BOILERPLATE_TAGS))
+        headings = [node.text(strip=True) for node in tree.css('h1, h2, h3')]
+        root = tree.css_first('main') or tree.css_first('article') or tree.body
+        body = root.text(separator="\n") if root else ""
+    else:
+        soup = parse(html)
+        title = soup.title.get_text(strip=True) if soup.title else ""
+        meta_node = soup.find('meta', attrs={'name': 'description'}) or soup.find('meta', attrs={'property': 'og:description'})
+        description = (meta_node.get('content') or "") if meta_node else ""
+        for tag in soup(PAGE_BOILERPLATE_TAGS):
+            tag.decompose()
+        headings = [node.get_text(" ", strip=True) for node in soup.find_all(['h1', 'h2', 'h3'])]
+        root = soup.find('main') or soup.find('article') or soup.body or soup
+        body = root.get_text("\n")
+
+    parts = []
+    if title:
+        parts.append(f"Title: {title}")
+    if description:
+        parts.append(f"Description: {' '.join(description.split())}")
+    headings = [h for h in headings if h]
+    if headings:
+        parts.append("Headings: " + " | ".join(dict.fromkeys(headings)))
+    parts.append(_collapse_lines(body))
+    return truncate_to_tokens("\n\n".join(parts), max_tokens)
+
+
+def parse_document(filename, file_bytes, max_pages, max_chars):
+    """Extract text from document bytes, runs inside the document process pool"""
+    name = filename.lower()
+    file_stream = io.BytesIO(file_bytes)
+    parts = []
+    size = 0
+
+    if name.endswith('.pdf'):
+        import PyPDF2
+        pdf_reader = PyPDF2.PdfReader(file_stream)
+        for page in pdf_reader.pages[:max_pages]:
+            text = page.extract_text() or ""
+            parts.append(text)
+            size += len(text)
+            if size >= max_chars:
+                break
+
+    elif name.endswith(('.docx', '.doc')):
+        import docx
+        doc = docx.Document(file_stream)
+        for paragraph in doc.paragraphs:
+            parts.append(paragraph.text)
+            size += len(paragraph.text) + 1
+            if size >= max_chars:
+                break
+
+    elif name.endswith(('.txt', '.md')):
+        return file_bytes[:max_chars * 4].decode('utf-8', errors='ignore')[:max_chars]
+
+    return "\n".join(parts)[:max_chars]
+
+
+class SkillIndex:
+    """Per-guild inverted index from normalized skill/interest terms to discord ids
+
+    Writers hold the lock. The id sets of a loaded guild are never changed in
+    place but replaced, so lookup (on the event loop) reads without the lock
+    and never waits for a guild being built in a db thread.
+    """
     def __init__(self):
-        self.db_path = 'discord_bot.db'  # Creates file in same directory
-        self.init_database()
-    
-    @contextmanager
-    def get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_path)
+        self._guilds = {}       # server_id -> {term: set(discord_id)}
+        self._user_terms = {}   # discord_id -> (server_id, frozenset(terms))
+        self.lock = threading.RLock()
+
+    def is_loaded(self, server_id):
+        return server_id in self._guilds
+
+    def load_guild(self, server_id, rows):
+        """(re)build the index of one guild from rows of (discord_id, skills, interests)"""
+        index = {}
+        user_terms = {}
+        for discord_id, skills, interests in rows:
+            terms = frozenset(split_terms(skills, interests))
+            user_terms[discord_id] = terms
+            for term in terms:
+                index.setdefault(term, set()).add(discord_id)
+
+        with self.lock:
+            for discord_id, (old_server, _) in list(self._user_terms.items()):
+                if old_server == server_id and discord_id not in user_terms:
+                    del self._user_terms[discord_id]
+            for discord_id, terms in user_terms.items():
+                self._user_terms[discord_id] = (server_id, terms)
+            self._guilds[server_id] = index
+
+    def unload_guild(self, server_id):
+        """forget a guild, it is rebuilt from the table on next use"""
+        with self.lock:
+            self._guilds.pop(server_id, None)
+            for discord_id, (old_server, _) in list(self._user_terms.items()):
+                if old_server == server_id:
+                    del self._user_terms[discord_id]
+
+    def update_user(self, discord_id, server_id, skills, interests):
+        """replace the indexed terms of one user in place"""
+        new_terms = frozenset(split_terms(skills, interests))
+        with self.lock:
+            old_server, old_terms = self._user_terms.get(discord_id, (None, frozenset()))
+            old_index = self._guilds.get(old_server)
+            if old_index is not None:
+                for term in old_terms:
+                    ids = old_index.get(term)
+                    if ids is not None and discord_id in ids:
+                        ids = ids - {discord_id}
+                        if ids:
+                            old_index[term] = ids
+                        else:
+                            del old_index[term]
+
+            self._user_terms[discord_id] = (server_id, new_terms)
+            index = self._guilds.get(server_id)
+            # Guilds that were never loaded are built from the table on first use
+            if index is not None:
+                for term in new_terms:
+                    index[term] = index.get(term, frozenset()) | {discord_id}
+
+    def lookup(self, server_id, keywords):
+        """return {discord_id: number of matched keywords} for a list of keywords"""
+        index = self._guilds.get(server_id, {})
+        matches = {}
+        for keyword in {normalize_term(k) for k in keywords}:
+            for discord_id in index.get(keyword, ()):
+                matches[discord_id] = matches.get(discord_id, 0) + 1
+        return matches
+
+
+# Abbreviations people write instead of the registered skill (and vice versa)
+SKILL_SYNONYMS = {
+    'ml': 'machine learning',
+    'dl': 'deep learning',
+    'ai': 'artificial intelligence',
+    'nlp': 'natural language processing',
+    'cv': 'computer vision',
+    'rl': 'reinforcement learning',
+    'llm': 'large language models',
+    'genai': 'generative ai',
+    'js': 'javascript',
+    'ts': 'typescript',
+    'py': 'python',
+    'k8s': 'kubernetes',
+    'golang': 'go',
+    'postgres': 'postgresql',
+    'gcp': 'google cloud',
+    'aws': 'amazon web services',
+    'ci/cd': 'continuous integration',
+    'oss': 'open source',
+    'ui': 'user interface',
+    'ux': 'user experience',
+}
+
+# Registered skills that are also everyday words, never trusted as exact hits
+COMMON_WORD_SKILLS = {'go', 'swift', 'rust', 'spring', 'julia', 'ruby', 'dart', 'elixir', 'express'}
+
+
+class SkillMatcher:
+    """Local matcher for a guild's skill vocabulary
+
+    Terms are compiled into sets of word tuples: exact phrases, plus stemmed
+    phrases and synonym expansions that only count as candidates, along with
+    every proper prefix of them. scan() is a single pass over the text that
+    only extends an n-gram while some term starts with it, so its cost grows
+    with neither the vocabulary size nor the length of its longest term.
+    """
+
+    TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#./]*")
+
+    def __init__(self, terms):
+        self.exact = {}  # word tuple -> term
+        self.fuzzy = {}  # stemmed word tuple -> set(terms)
+        self.exact_prefixes = set()
+        self.fuzzy_prefixes = set()
+
+        synonyms = {}
+        for short, full in SKILL_SYNONYMS.items():
+            synonyms.setdefault(short, set()).add(full)
+            synonyms.setdefault(full, set()).add(short)
+
+        for term in terms:
+            words = self.tokenize(term)
+            if not words:
+                continue
+            if len(term) > 2 and term not in COMMON_WORD_SKILLS:
+                self.exact[words] = term
+                self.exact_prefixes.update(words[:n] for n in range(1, len(words)))
+
+            variants = [words] + [self.tokenize(alias) for alias in synonyms.get(" ".join(words), ())]
+            for variant in variants:
+                if not variant:
+                    continue
+                stems = self.stem_words(variant)
+                self.fuzzy.setdefault(stems, set()).add(term)
+                self.fuzzy_prefixes.update(stems[:n] for n in range(1, len(stems)))
+
+    @classmethod
+    def tokenize(cls, text):
+        words = (word.rstrip('./') for word in cls.TOKEN_PATTERN.findall(text.lower()))
+        return tuple(word for word in words if word)
+
+    @staticmethod
+    def stem(word):
+        """very small suffix stripper, enough to line up plurals and -ing forms"""
+        if len(word) > 4 and word.endswith('ies'):
+            return word[:-3] + 'y'
+        if len(word) > 5 and word.endswith('ing'):
+            return word[:-3]
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            return word[:-1]
+        return word
+
+    @classmethod
+    def stem_words(cls, words):
+        return tuple(cls.stem(word) for word in words)
+
+    def scan(self, text):
+        """return (exact term hits, candidate-only term hits) found in text"""
+        words = self.tokenize(text)
+        stems = self.stem_words(words)
+        exact_hits = set()
+        candidates = set()
+        count = len(words)
+        for i in range(count):
+            exact_open = fuzzy_open = True
+            for end in range(i + 1, count + 1):
+                if exact_open:
+                    key = words[i:end]
+                    term = self.exact.get(key)
+                    if term is not None:
+                        exact_hits.add(term)
+                    exact_open = key in self.exact_prefixes
+                if fuzzy_open:
+                    key = stems[i:end]
+                    fuzzy = self.fuzzy.get(key)
+                    if fuzzy is not None:
+                        candidates.update(fuzzy)
+                    fuzzy_open = key in self.fuzzy_prefixes
+                if not (exact_open or fuzzy_open):
+                    break
+        return exact_hits, candidates - exact_hits
+
+
+PROFILE_FIELDS = ('discord_id', 'discord_username', 'job_title', 'skills', 'interests')
+
+
+def iter_profile_records(filename, data):
+    """profile dicts of an uploaded CSV, JSON lines or JSON array file, one at a time"""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        yield from csv.DictReader(io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline=''))
+    elif name.endswith(('.jsonl', '.ndjson')):
+        for line in io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig'):
+            if line.strip():
+                yield json.loads(line)
+    elif name.endswith('.json'):
+        # A plain JSON document can't be parsed incrementally, MAX_IMPORT_BYTES bounds it
+        records = json.loads(data.decode('utf-8-sig'))
+        yield from records.get('profiles', []) if isinstance(records, dict) else records
+    else:
+        raise ValueError("expected a .csv, .json or .jsonl file")
+
+
+def profile_row(record):
+    """(discord_id, username, job_title, skills, interests) of a record, None if unusable"""
+    def text(value):
+        if isinstance(value, (list, tuple)):
+            return ", ".join(str(item).strip() for item in value)
+        return str(value).strip() if value is not None else ''
+
+    if not isinstance(record, dict):
+        return None
+    try:
+        discord_id = int(str(record.get('discord_id')).strip())
+    except (TypeError, ValueError):
+        return None
+    return (
+        discord_id,
+        text(record.get('discord_username')) or None,
+        text(record.get('job_title')),
+        text(record.get('skills')),
+        text(record.get('interests')),
+    )
+
+URL_PATTERN = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+
+
+class RoutingRules:
+    """Which messages of a guild are worth sending to the resource pipeline
+
+    resources() only looks at what the gateway already delivered (channel,
+    content, attachment names and sizes), so deciding costs no I/O. An empty
+    watch list means every channel that isn't ignored is watched.
+    """
+
+    DEFAULT_ATTACHMENT_TYPES = ('.pdf', '.docx', '.doc', '.txt', '.md')
+    __slots__ = ('watch_channels', 'ignore_channels', 'attachment_types', 'min_urls', 'max_urls')
+
+    def __init__(self, watch_channels=(), ignore_channels=(), attachment_types=None, min_urls=1, max_urls=None):
+        self.watch_channels = frozenset(watch_channels)
+        self.ignore_channels = frozenset(ignore_channels)
+        self.attachment_types = tuple(attachment_types) if attachment_types is not None else self.DEFAULT_ATTACHMENT_TYPES
+        self.min_urls = min_urls
+        self.max_urls = max_urls if max_urls is not None else Config.MAX_URLS_PER_MESSAGE
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            json.loads(row['watch_channels']),
+            json.loads(row['ignore_channels']),
+            json.loads(row['attachment_types']),
+            row['min_urls'],
+            row['max_urls'],
+        )
+
+    def to_row(self, server_id):
+        return (
+            server_id,
+            json.dumps(sorted(self.watch_channels)),
+            json.dumps(sorted(self.ignore_channels)),
+            json.dumps(list(self.attachment_types)),
+            self.min_urls,
+            self.max_urls,
+        )
+
+    def channel_allowed(self, channel):
+        # Threads follow the rules of the channel they were started in
+        channel_ids = {channel.id, getattr(channel, 'parent_id', None)}
+        if channel_ids & self.ignore_channels:
+            return False
+        return not self.watch_channels or bool(channel_ids & self.watch_channels)
+
+    def resources(self, message):
+        """(kind, resource) pairs of a message worth analyzing, without any I/O"""
+        if not self.channel_allowed(message.channel):
+            return []
+
+        resources = []
+        # The substring test rejects most chat messages before the regex runs
+        if self.max_urls and 'http' in message.content:
+            urls = list(dict.fromkeys(URL_PATTERN.findall(message.content)))
+            if len(urls) >= self.min_urls:
+                resources.extend(('url', url) for url in urls[:self.max_urls])
+        for attachment in message.attachments:
+            if attachment.size <= Config.MAX_ATTACHMENT_BYTES and \
+                    attachment.filename.lower().endswith(self.attachment_types):
+                resources.append(('attachment', attachment))
+        return resources
+
+
+class ConnectionPool:
+    """Small pool of persistent SQLite connections running in WAL mode"""
+    def __init__(self, db_path, size):
+        self.db_path = db_path
+        self.size = size
+        self._connections = queue.Queue()
+        for _ in range(size):
+            self._connections.put(self._connect())
+
+    def _connect(self):
+        # Connections are shared by the db worker threads, never used concurrently
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            check_same_thread=False,
+            cached_statements=256
+        )
         conn.row_factory = sqlite3.Row  # Enable column access by name
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, rolling back anything left uncommitted"""
+        conn = self._connections.get()
         try:
             yield conn
         finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._connections.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._connections.get_nowait()
+            except queue.Empty:
+                break
             conn.close()
-    
+
+
+class DatabaseManager:
+    """Database class for all the sql files - SQLite version
+
+    Every public query is a coroutine that runs on a small pool of db worker
+    threads, so disk I/O never blocks the gateway event loop. The statements
+    are kept as class constants so each pooled connection prepares them once
+    and then reuses them from its statement cache.
+    """
+
+    UPSERT_USER = '''
+        INSERT INTO users (discord_id, discord_username, server_id,
+                           job_title, skills, interests)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(discord_id) DO UPDATE SET
+            discord_username = excluded.discord_username,
+            server_id = excluded.server_id,
+            job_title = excluded.job_title,
+            skills = excluded.skills,
+            interests = excluded.interests,
+            updated_at = CURRENT_TIMESTAMP
+    '''
+    SELECT_USER = 'SELECT * FROM users WHERE discord_id = ? AND server_id = ?'
+    SELECT_USERS = 'SELECT * FROM users WHERE server_id = ?'
+    SELECT_PROFILE_TERMS = 'SELECT server_id, skills, interests FROM users WHERE discord_id = ?'
+    SELECT_INDEX_ROWS = 'SELECT discord_id, skills, interests FROM users WHERE server_id = ?'
+    UPSERT_THEME = '''
+        INSERT INTO server_configs (server_id, theme) VALUES (?, ?)
+        ON CONFLICT(server_id) DO UPDATE SET theme = excluded.theme
+    '''
+    SELECT_THEME = 'SELECT theme FROM server_configs WHERE server_id = ?'
+    INSERT_JOB = 'INSERT INTO pending_jobs (server_id, channel_id, message_id) VALUES (?, ?, ?)'
+    DELETE_JOB = 'DELETE FROM pending_jobs WHERE id = ?'
+    SELECT_JOBS = 'SELECT id, server_id, channel_id, message_id FROM pending_jobs ORDER BY id'
+    SELECT_VOCABULARY = 'SELECT term, user_count FROM skill_vocabulary WHERE server_id = ?'
+    INCREMENT_TERM = '''
+        INSERT INTO skill_vocabulary (server_id, term, user_count) VALUES (?, ?, 1)
+        ON CONFLICT(server_id, term) DO UPDATE SET user_count = user_count + 1
+    '''
+    DECREMENT_TERM = 'UPDATE skill_vocabulary SET user_count = user_count - 1 WHERE server_id = ? AND term = ?'
+    DELETE_EMPTY_TERMS = 'DELETE FROM skill_vocabulary WHERE server_id = ? AND user_count <= 0'
+    INSERT_CHANGE = 'INSERT INTO change_log (server_id, discord_id, kind, origin, created_at) VALUES (?, ?, ?, ?, ?)'
+    SELECT_CHANGES = 'SELECT id, server_id, discord_id, kind, origin FROM change_log WHERE id > ? ORDER BY id'
+    SELECT_LAST_CHANGE = 'SELECT COALESCE(MAX(id), 0) FROM change_log'
+    PRUNE_CHANGES = 'DELETE FROM change_log WHERE created_at < ?'
+    COUNT_USERS = 'SELECT COUNT(*) FROM users WHERE server_id = ?'
+    SELECT_EXPORT = '''
+        SELECT discord_id, discord_username, job_title, skills, interests
+        FROM users WHERE server_id = ? ORDER BY discord_id
+    '''
+    SELECT_ROUTING = 'SELECT * FROM guild_routing WHERE server_id = ?'
+    SELECT_ALL_ROUTING = 'SELECT * FROM guild_routing'
+    UPSERT_ROUTING = '''
+        INSERT INTO guild_routing (server_id, watch_channels, ignore_channels, attachment_types, min_urls, max_urls)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(server_id) DO UPDATE SET
+            watch_channels = excluded.watch_channels,
+            ignore_channels = excluded.ignore_channels,
+            attachment_types = excluded.attachment_types,
+            min_urls = excluded.min_urls,
+            max_urls = excluded.max_urls
+    '''
+    DELETE_ROUTING = 'DELETE FROM guild_routing WHERE server_id = ?'
+    SELECT_META = 'SELECT value FROM bot_meta WHERE key = ?'
+    UPSERT_META = '''
+        INSERT INTO bot_meta (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    '''
+    SELECT_RESOURCE_STATS = '''
+        SELECT COUNT(*), COALESCE(SUM(tagged_count), 0), COALESCE(SUM(cache_hit), 0)
+        FROM resources WHERE server_id = ? AND created_at >= ?
+    '''
+
+    def __init__(self, db_path=None, pool_size=None):
+        self.db_path = db_path or Config.DATABASE_PATH
+        self.pool_size = pool_size or Config.DB_POOL_SIZE
+        self.pool = ConnectionPool(self.db_path, self.pool_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='ozo-db')
+        self.skill_index = SkillIndex()
+        self._vocab_counts = {}   # server_id -> {term: user_count}
+        self._vocabularies = {}   # server_id -> Vocabulary built from the counts
+        self._vocab_lock = threading.RLock()
+        # async callbacks(profile dict) run after every save_user
+        self.profile_listeners = []
+        # Other processes share the database, tell them what changed
+        self.change_log = Config.SHARD_PROCESSES > 1
+        self.origin = f"{os.getpid()}-{time.time_ns()}"
+        self._last_change_id = 0
+        self._last_prune = 0.0
+        # callbacks(kind, server_id) run for changes made by other processes
+        self.change_listeners = []
+        self._stats_cache = {}  # server_id -> (expires_at, stats dict)
+        # Every guild's routing rules live in memory, on_message never queries them
+        self._routing = {}  # server_id -> RoutingRules
+        self.default_routing = RoutingRules()
+        self.init_database()
+
+    @contextmanager
+    def get_connection(self):
+        """Context manager for pooled database connections"""
+        with self.pool.connection() as conn:
+            yield conn
+
+    async def run(self, func, *args):
+        """Run a blocking database function on the db worker threads"""
+        loop = asyncio.get_running_loop()
+        with timed_stage('db'):
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
     def init_database(self):
         """Initialize database tables"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            
+
             # Users table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -80,12 +788,12 @@ class DatabaseManager:
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
-            
+
             # Create index for server_id
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_server ON users(server_id)
             ''')
-            
+
             # Server configurations table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS server_configs (
@@ -94,7 +802,7 @@ class DatabaseManager:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
-            
+
             # Resources tracking table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS resources (
@@ -105,147 +813,1269 @@ class DatabaseManager:
                     resource_url TEXT,
                     resource_summary TEXT,
                     tagged_users TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    resource_key TEXT,
+                    keywords TEXT,
+                    tagged_count INTEGER DEFAULT 0,
+                    cache_hit INTEGER DEFAULT 0,
+                    timings TEXT
+                )
+            ''')
+
+            # Columns added for the resource history, on tables created before it
+            columns = {row['name'] for row in cursor.execute('PRAGMA table_info(resources)')}
+            for column, column_type in (('resource_key', 'TEXT'), ('keywords', 'TEXT'),
+                                        ('tagged_count', 'INTEGER DEFAULT 0'),
+                                        ('cache_hit', 'INTEGER DEFAULT 0'), ('timings', 'TEXT')):
+                if column not in columns:
+                    cursor.execute(f'ALTER TABLE resources ADD COLUMN {column} {column_type}')
+
+            # Per guild, per time range history queries, covering the /stats sums;
+            # created_at alone for retention
+            cursor.execute('DROP INDEX IF EXISTS idx_server_resource')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_resource_stats
+                ON resources(server_id, created_at, tagged_count, cache_hit)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_resource_time ON resources(created_at)
+            ''')
+
+            # LLM analysis results keyed by resource + skill vocabulary
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    resource_key TEXT,
+                    keywords TEXT,
+                    created_at REAL,
+                    last_used REAL
+                )
+            ''')
+
+            # Create index for LRU eviction
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_cache_last_used ON analysis_cache(last_used)
+            ''')
+
+            # Messages queued for analysis but not processed yet
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS pending_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    server_id INTEGER,
+                    channel_id INTEGER,
+                    message_id INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
-            
-            # Create index for server_id in resources
+
+            # Cached profile embeddings for the embedding match mode
             cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_server_resource ON resources(server_id)
+                CREATE TABLE IF NOT EXISTS user_embeddings (
+                    discord_id INTEGER PRIMARY KEY,
+                    server_id INTEGER,
+                    model TEXT,
+                    vector BLOB,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
             ''')
-            
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_server_embedding ON user_embeddings(server_id)
+            ''')
+
+            # Deduplicated skills/interests per server with how many users list them
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS skill_vocabulary (
+                    server_id INTEGER,
+                    term TEXT,
+                    user_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (server_id, term)
+                )
+            ''')
+
+            # Profile/theme changes, polled by the other shard processes; discord_id
+            # is set when a single profile changed, NULL when the whole guild did
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS change_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    server_id INTEGER,
+                    discord_id INTEGER,
+                    kind TEXT,
+                    origin TEXT,
+                    created_at REAL
+                )
+            ''')
+
+            # Per guild channel/attachment rules deciding which messages get analyzed
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS guild_routing (
+                    server_id INTEGER PRIMARY KEY,
+                    watch_channels TEXT,
+                    ignore_channels TEXT,
+                    attachment_types TEXT,
+                    min_urls INTEGER,
+                    max_urls INTEGER
+                )
+            ''')
+
+            # Small bot wide state, e.g. the hash of the last synced command tree
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bot_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+
             conn.commit()
-    
-    def save_user(self, discord_id, discord_username, server_id, job_title, skills, interests):
-        """Save or update user profile"""
+            self._last_change_id = cursor.execute(self.SELECT_LAST_CHANGE).fetchone()[0]
+            self._routing = {
+                row['server_id']: RoutingRules.from_row(row)
+                for row in cursor.execute(self.SELECT_ALL_ROUTING).fetchall()
+            }
+
+            # Backfill the vocabulary of databases created before it existed
+            if cursor.execute('SELECT 1 FROM skill_vocabulary LIMIT 1').fetchone() is None:
+                self._rebuild_vocabulary(conn)
+                conn.commit()
+
+    def _rebuild_vocabulary(self, conn, server_ids=None):
+        """Recount the vocabulary of some (or all) servers from the users table"""
+        if server_ids is None:
+            rows = conn.execute('SELECT server_id, skills, interests FROM users')
+            conn.execute('DELETE FROM skill_vocabulary')
+        else:
+            server_ids = list(server_ids)
+            placeholders = ", ".join("?" * len(server_ids))
+            rows = conn.execute(
+                f'SELECT server_id, skills, interests FROM users WHERE server_id IN ({placeholders})',
+                server_ids
+            )
+            conn.execute(f'DELETE FROM skill_vocabulary WHERE server_id IN ({placeholders})', server_ids)
+
+        counts = {}
+        for row in rows.fetchall():
+            for term in split_terms(row['skills'], row['interests']):
+                key = (row['server_id'], term)
+                counts[key] = counts.get(key, 0) + 1
+
+        conn.executemany(
+            'INSERT INTO skill_vocabulary (server_id, term, user_count) VALUES (?, ?, ?)',
+            [(server_id, term, count) for (server_id, term), count in counts.items()]
+        )
+
+        with self._vocab_lock:
+            for server_id in (server_ids if server_ids is not None else list(self._vocab_counts)):
+                self._vocab_counts.pop(server_id, None)
+                self._vocabularies.pop(server_id, None)
+
+    def _save_user(self, discord_id, discord_username, server_id, job_title, skills, interests):
+        new_terms = split_terms(skills, interests)
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if user exists
-            cursor.execute('''
-                SELECT discord_id FROM users WHERE discord_id = ? AND server_id = ?
-            ''', (discord_id, server_id))
-            
-            if cursor.fetchone():
-                # Update existing user
-                cursor.execute('''
-                    UPDATE users 
-                    SET discord_username = ?, job_title = ?, skills = ?, 
-                        interests = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE discord_id = ? AND server_id = ?
-                ''', (discord_username, job_title, skills, interests, discord_id, server_id))
+            # IMMEDIATE so two saves of the same user can't both diff against the old row
+            conn.execute('BEGIN IMMEDIATE')
+            old = conn.execute(self.SELECT_PROFILE_TERMS, (discord_id,)).fetchone()
+            conn.execute(self.UPSERT_USER, (discord_id, discord_username, server_id,
+                                            job_title, skills, interests))
+
+            old_server = old['server_id'] if old else None
+            old_terms = split_terms(old['skills'], old['interests']) if old else set()
+            if old_server == server_id:
+                removed, added = old_terms - new_terms, new_terms - old_terms
             else:
-                # Insert new user
-                cursor.execute('''
-                    INSERT INTO users (discord_id, discord_username, server_id, 
-                                     job_title, skills, interests)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (discord_id, discord_username, server_id, job_title, skills, interests))
-            
+                removed, added = old_terms, new_terms
+            if removed:
+                conn.executemany(self.DECREMENT_TERM, [(old_server, term) for term in removed])
+                conn.execute(self.DELETE_EMPTY_TERMS, (old_server,))
+            if added:
+                conn.executemany(self.INCREMENT_TERM, [(server_id, term) for term in added])
+            self._log_change(conn, 'profile', {old_server, server_id} - {None}, discord_id)
+            # Commit and patch the cached counts under the lock _load_vocabulary
+            # reads under, so a load can't see the new counts and get the diff too
+            with self._vocab_lock:
+                conn.commit()
+                self._update_vocabulary(old_server, removed, server_id, added)
+
+        self.skill_index.update_user(discord_id, server_id, skills, interests)
+        self._stats_cache.pop(old_server, None)
+        self._stats_cache.pop(server_id, None)
+
+    def _update_vocabulary(self, old_server, removed, server_id, added):
+        """apply a profile change to the in-memory vocabulary counts"""
+        with self._vocab_lock:
+            counts = self._vocab_counts.get(old_server)
+            if counts is not None and removed:
+                for term in removed:
+                    counts[term] = counts.get(term, 0) - 1
+                    if counts[term] <= 0:
+                        del counts[term]
+                self._vocabularies.pop(old_server, None)
+
+            counts = self._vocab_counts.get(server_id)
+            if counts is not None and added:
+                for term in added:
+                    counts[term] = counts.get(term, 0) + 1
+                self._vocabularies.pop(server_id, None)
+
+    async def save_user(self, discord_id, discord_username, server_id, job_title, skills, interests):
+        """Save or update user profile"""
+        await self.run(self._save_user, discord_id, discord_username, server_id,
+                       job_title, skills, interests)
+
+        profile = {
+            'discord_id': discord_id,
+            'server_id': server_id,
+            'job_title': job_title,
+            'skills': skills,
+            'interests': interests,
+        }
+        for listener in self.profile_listeners:
+            try:
+                await listener(profile)
+            except Exception as e:
+                logger.error(f"Error in profile listener {listener}: {e}")
+
+    def _import_users(self, server_id, records, member_ids=None):
+        imported = 0
+        skipped = {'invalid': 0, 'other_server': 0, 'not_member': 0}
+        records = iter(records)
+        with self.get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            while True:
+                chunk = list(itertools.islice(records, Config.IMPORT_CHUNK_SIZE))
+                if not chunk:
+                    break
+                rows = [row for row in map(profile_row, chunk) if row is not None]
+                skipped['invalid'] += len(chunk) - len(rows)
+                if member_ids is not None:
+                    members = [row for row in rows if row[0] in member_ids]
+                    skipped['not_member'] += len(rows) - len(members)
+                    rows = members
+                if not rows:
+                    continue
+                # A profile registered in another server is never overwritten or moved
+                ids = [row[0] for row in rows]
+                placeholders = ", ".join("?" * len(ids))
+                taken = {
+                    row[0] for row in conn.execute(
+                        f'SELECT discord_id FROM users WHERE discord_id IN ({placeholders}) AND server_id != ?',
+                        ids + [server_id]
+                    )
+                }
+                if taken:
+                    kept = [row for row in rows if row[0] not in taken]
+                    skipped['other_server'] += len(rows) - len(kept)
+                    rows = kept
+                conn.executemany(self.UPSERT_USER, [
+                    (discord_id, username, server_id, job_title, skills, interests)
+                    for discord_id, username, job_title, skills, interests in rows
+                ])
+                imported += len(rows)
+
+            # Once for the whole import instead of a vocabulary diff per row
+            self._rebuild_vocabulary(conn, [server_id])
+            self._log_change(conn, 'profile', [server_id])
             conn.commit()
-    
-    def get_user(self, discord_id, server_id):
-        """Get user profile"""
+
+        self.invalidate_guild(server_id)
+        self._stats_cache.pop(server_id, None)
+        return imported, skipped
+
+    async def import_users(self, server_id, filename, data, member_ids=None):
+        """Upsert the profiles of a CSV/JSON file in one transaction, returns (imported, skipped)
+
+        Records are parsed as they are written, in chunks of IMPORT_CHUNK_SIZE
+        per executemany. Records of users registered in another server, and
+        of users not in member_ids when it is given, are skipped and counted
+        by reason. The skill index, vocabulary and embeddings of the server
+        are rebuilt once at the end, lazily on next use.
+        """
+        imported, skipped = await self.run(
+            self._import_users, server_id, iter_profile_records(filename, data), member_ids
+        )
+        for listener in self.change_listeners:
+            await listener('profile', server_id, None)
+        return imported, skipped
+
+    def _export_users(self, server_id, file_format):
+        buffer = io.StringIO()
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM users WHERE discord_id = ? AND server_id = ?
-            ''', (discord_id, server_id))
-            
-            row = cursor.fetchone()
+            cursor = conn.execute(self.SELECT_EXPORT, (server_id,))
+            if file_format == 'csv':
+                writer = csv.writer(buffer)
+                writer.writerow(PROFILE_FIELDS)
+                writer.writerows(tuple(row) for row in cursor)
+            else:
+                for row in cursor:
+                    buffer.write(json.dumps(dict(row)) + "\n")
+        return buffer.getvalue().encode('utf-8')
+
+    async def export_users(self, server_id, file_format='csv'):
+        """All profiles of a server as CSV or JSON lines bytes"""
+        return await self.run(self._export_users, server_id, file_format)
+
+    def _get_user(self, discord_id, server_id):
+        with self.get_connection() as conn:
+            row = conn.execute(self.SELECT_USER, (discord_id, server_id)).fetchone()
             if row:
                 return dict(row)
             return None
-    
-    def get_all_users(self, server_id):
-        """Get all users in a server"""
+
+    async def get_user(self, discord_id, server_id):
+        """Get user profile"""
+        return await self.run(self._get_user, discord_id, server_id)
+
+    def _get_all_users(self, server_id):
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM users WHERE server_id = ?
-            ''', (server_id,))
-            
-            rows = cursor.fetchall()
+            rows = conn.execute(self.SELECT_USERS, (server_id,)).fetchall()
             return [dict(row) for row in rows]
-    
-    def get_skills(self, server_id):
-        """get skills of all users in a server"""
+
+    async def get_all_users(self, server_id):
+        """Get all users in a server"""
+        return await self.run(self._get_all_users, server_id)
+
+    def _load_vocabulary(self, server_id):
+        # Connection first, then the lock, the order _save_user holds them in
+        with self.get_connection() as conn, self._vocab_lock:
+            if server_id not in self._vocab_counts:
+                rows = conn.execute(self.SELECT_VOCABULARY, (server_id,)).fetchall()
+                self._vocab_counts[server_id] = {row['term']: row['user_count'] for row in rows}
+
+            vocabulary = self._vocabularies.get(server_id)
+            if vocabulary is None:
+                vocabulary = Vocabulary(self._vocab_counts[server_id], server_id)
+                self._vocabularies[server_id] = vocabulary
+            return vocabulary
+
+    async def get_vocabulary(self, server_id):
+        """Deduplicated skill/interest vocabulary of a server, cached in memory"""
+        vocabulary = self._vocabularies.get(server_id)
+        if vocabulary is not None:
+            return vocabulary
+        return await self.run(self._load_vocabulary, server_id)
+
+    def _ensure_skill_index(self, server_id):
+        # Held across the read so a concurrent save_user can't be lost between
+        # reading the rows and installing the index
+        with self.skill_index.lock:
+            if not self.skill_index.is_loaded(server_id):
+                with self.get_connection() as conn:
+                    rows = conn.execute(self.SELECT_INDEX_ROWS, (server_id,)).fetchall()
+                self.skill_index.load_guild(
+                    server_id,
+                    [(row['discord_id'], row['skills'], row['interests']) for row in rows]
+                )
+        return self.skill_index
+
+    async def ensure_skill_index(self, server_id):
+        """Build the skill index of a server from the users table if not loaded yet"""
+        if self.skill_index.is_loaded(server_id):
+            return self.skill_index
+        return await self.run(self._ensure_skill_index, server_id)
+
+    def _save_server_theme(self, server_id, theme):
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT skills FROM users WHERE server_id = ?
-            ''', (server_id,))
-            
-            rows = cursor.fetchall()
-            return [{'skills': row['skills']} for row in rows]
-    
-    def save_server_theme(self, server_id, theme):
+            conn.execute(self.UPSERT_THEME, (server_id, theme))
+            self._log_change(conn, 'theme', [server_id])
+            conn.commit()
+
+    async def save_server_theme(self, server_id, theme):
         """Save server theme configuration"""
+        await self.run(self._save_server_theme, server_id, theme)
+        self._stats_cache.pop(server_id, None)
+
+    def _get_server_theme(self, server_id):
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if config exists
-            cursor.execute('''
-                SELECT server_id FROM server_configs WHERE server_id = ?
-            ''', (server_id,))
-            
-            if cursor.fetchone():
-                # Update existing config
-                cursor.execute('''
-                    UPDATE server_configs SET theme = ? WHERE server_id = ?
-                ''', (theme, server_id))
+            result = conn.execute(self.SELECT_THEME, (server_id,)).fetchone()
+            return result['theme'] if result else Config.GROUP_THEME
+
+    async def get_server_theme(self, server_id):
+        """Get server theme"""
+        return await self.run(self._get_server_theme, server_id)
+
+    def _log_change(self, conn, kind, server_ids, discord_id=None):
+        """record a change in the caller's transaction, when other processes share the db"""
+        if self.change_log:
+            now = time.time()
+            conn.executemany(self.INSERT_CHANGE, [
+                (server_id, discord_id, kind, self.origin, now) for server_id in server_ids
+            ])
+
+    def _drop_vocabulary(self, server_id):
+        with self._vocab_lock:
+            self._vocab_counts.pop(server_id, None)
+            self._vocabularies.pop(server_id, None)
+
+    def invalidate_guild(self, server_id):
+        """drop the in-memory index and vocabulary of a guild"""
+        self.skill_index.unload_guild(server_id)
+        self._drop_vocabulary(server_id)
+
+    def _reload_user(self, discord_id):
+        """re-index one profile another process saved"""
+        with self.get_connection() as conn:
+            row = conn.execute(self.SELECT_PROFILE_TERMS, (discord_id,)).fetchone()
+        if row is not None:
+            self.skill_index.update_user(discord_id, row['server_id'], row['skills'], row['interests'])
+
+    def _poll_changes(self):
+        now = time.time()
+        with self.get_connection() as conn:
+            rows = conn.execute(self.SELECT_CHANGES, (self._last_change_id,)).fetchall()
+            if now - self._last_prune > Config.CHANGE_LOG_RETENTION_SECONDS:
+                conn.execute(self.PRUNE_CHANGES, (now - Config.CHANGE_LOG_RETENTION_SECONDS,))
+                conn.commit()
+                self._last_prune = now
+
+        changes = set()
+        for row in rows:
+            self._last_change_id = max(self._last_change_id, row['id'])
+            # Our own changes were already applied in memory by whoever made them
+            if row['origin'] != self.origin:
+                changes.add((row['kind'], row['server_id'], row['discord_id']))
+
+        invalidated = {server_id for kind, server_id, discord_id in changes if kind == 'profile' and discord_id is None}
+        users = set()
+        for kind, server_id, discord_id in changes:
+            self._stats_cache.pop(server_id, None)
+            if kind == 'profile':
+                if server_id in invalidated:
+                    self.invalidate_guild(server_id)
+                    continue
+                # A single profile: patch its index entry, and re-read the
+                # guild's term counts (not its users) on next use
+                if discord_id not in users:
+                    users.add(discord_id)
+                    self._reload_user(discord_id)
+                self._drop_vocabulary(server_id)
+            elif kind == 'routing':
+                self._reload_routing(server_id)
+        return changes
+
+    async def poll_changes(self):
+        """Apply the profile/theme changes other bot processes made, returns them"""
+        changes = await self.run(self._poll_changes)
+        notified = set()
+        for kind, server_id, discord_id in changes:
+            # A user moving servers is logged for both, one notification is enough
+            key = (kind, server_id if discord_id is None else None, discord_id)
+            if key in notified:
+                continue
+            notified.add(key)
+            for listener in self.change_listeners:
+                await listener(kind, server_id, discord_id)
+        return changes
+
+    def routing_for(self, server_id):
+        """routing rules of a guild, straight from memory"""
+        return self._routing.get(server_id, self.default_routing)
+
+    def _reload_routing(self, server_id):
+        with self.get_connection() as conn:
+            row = conn.execute(self.SELECT_ROUTING, (server_id,)).fetchone()
+        if row is None:
+            self._routing.pop(server_id, None)
+        else:
+            self._routing[server_id] = RoutingRules.from_row(row)
+
+    def _save_routing(self, server_id, rules):
+        with self.get_connection() as conn:
+            if rules is None:
+                conn.execute(self.DELETE_ROUTING, (server_id,))
             else:
-                # Insert new config
-                cursor.execute('''
-                    INSERT INTO server_configs (server_id, theme) VALUES (?, ?)
-                ''', (server_id, theme))
-            
+                conn.execute(self.UPSERT_ROUTING, rules.to_row(server_id))
+            self._log_change(conn, 'routing', [server_id])
             conn.commit()
-    
-    def get_server_theme(self, server_id):
-        """Get server theme"""
+
+    async def save_routing(self, server_id, rules):
+        """Store the routing rules of a guild, None restores the defaults"""
+        await self.run(self._save_routing, server_id, rules)
+        if rules is None:
+            self._routing.pop(server_id, None)
+        else:
+            self._routing[server_id] = rules
+
+    def _get_meta(self, key):
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT theme FROM server_configs WHERE server_id = ?
-            ''', (server_id,))
-            
-            result = cursor.fetchone()
-            return result['theme'] if result else Config.GROUP_THEME
+            row = conn.execute(self.SELECT_META, (key,)).fetchone()
+        return row['value'] if row else None
+
+    async def get_meta(self, key):
+        return await self.run(self._get_meta, key)
+
+    def _set_meta(self, key, value):
+        with self.get_connection() as conn:
+            conn.execute(self.UPSERT_META, (key, value))
+            conn.commit()
+
+    async def set_meta(self, key, value):
+        await self.run(self._set_meta, key, value)
+
+    def _get_server_stats(self, server_id):
+        since = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - Config.STATS_WINDOW_DAYS * 86400))
+        with self.get_connection() as conn:
+            users = conn.execute(self.COUNT_USERS, (server_id,)).fetchone()[0]
+            theme = conn.execute(self.SELECT_THEME, (server_id,)).fetchone()
+            resources, tags, cache_hits = conn.execute(self.SELECT_RESOURCE_STATS, (server_id, since)).fetchone()
+        return {
+            'users': users,
+            'theme': theme['theme'] if theme else Config.GROUP_THEME,
+            'resources': resources,
+            'tags': tags,
+            'cache_hit_rate': cache_hits / resources if resources else 0.0,
+        }
+
+    async def get_server_stats(self, server_id):
+        """Counts behind /stats, cached for STATS_CACHE_SECONDS
+
+        Only aggregate queries on indexed columns, never the rows themselves.
+        Saving a profile or theme of the server drops its cached entry.
+        """
+        cached = self._stats_cache.get(server_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        stats = await self.run(self._get_server_stats, server_id)
+        self._stats_cache[server_id] = (time.monotonic() + Config.STATS_CACHE_SECONDS, stats)
+        return stats
+
+    def _add_pending_job(self, server_id, channel_id, message_id):
+        with self.get_connection() as conn:
+            cursor = conn.execute(self.INSERT_JOB, (server_id, channel_id, message_id))
+            conn.commit()
+            return cursor.lastrowid
+
+    async def add_pending_job(self, server_id, channel_id, message_id):
+        """Persist a queued resource job, returns its id"""
+        return await self.run(self._add_pending_job, server_id, channel_id, message_id)
+
+    def _delete_pending_job(self, job_id):
+        with self.get_connection() as conn:
+            conn.execute(self.DELETE_JOB, (job_id,))
+            conn.commit()
+
+    async def delete_pending_job(self, job_id):
+        """Forget a persisted job once it was processed or dropped"""
+        await self.run(self._delete_pending_job, job_id)
+
+    def _get_pending_jobs(self):
+        with self.get_connection() as conn:
+            return [dict(row) for row in conn.execute(self.SELECT_JOBS).fetchall()]
+
+    async def get_pending_jobs(self):
+        """Jobs left over from a previous run"""
+        return await self.run(self._get_pending_jobs)
+
+
+class ResultCache:
+    """Persistent LLM result cache stored in the bot database
+
+    Entries are keyed by the normalized url or the SHA-256 of an attachment,
+    combined with a hash of the skill vocabulary the LLM was asked about, so
+    a profile change naturally misses instead of serving stale keywords.
+    """
+
+    TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'ref_src')
+
+    SELECT_ENTRY = 'SELECT keywords, created_at FROM analysis_cache WHERE cache_key = ?'
+    TOUCH_ENTRY = 'UPDATE analysis_cache SET last_used = ? WHERE cache_key = ?'
+    DELETE_ENTRY = 'DELETE FROM analysis_cache WHERE cache_key = ?'
+    UPSERT_ENTRY = '''
+        INSERT INTO analysis_cache (cache_key, resource_key, keywords, created_at, last_used)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(cache_key) DO UPDATE SET
+            keywords = excluded.keywords,
+            created_at = excluded.created_at,
+            last_used = excluded.last_used
+    '''
+    DELETE_EXPIRED = 'DELETE FROM analysis_cache WHERE created_at < ?'
+    EVICT_LRU = '''
+        DELETE FROM analysis_cache WHERE cache_key IN (
+            SELECT cache_key FROM analysis_cache
+            ORDER BY last_used DESC LIMIT -1 OFFSET ?
+        )
+    '''
+
+    def __init__(self, db_manager, ttl=None, max_entries=None):
+        self.db_manager = db_manager
+        self.ttl = ttl if ttl is not None else Config.CACHE_TTL_SECONDS
+        self.max_entries = max_entries if max_entries is not None else Config.CACHE_MAX_ENTRIES
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def url_key(cls, url):
+        """normalize a url so trivially different reposts share one entry"""
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or '').lower()
+        if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+            host = f"{host}:{parts.port}"
+        path = parts.path.rstrip('/') or '/'
+        query = urlencode(sorted(
+            (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if not k.lower().startswith(cls.TRACKING_PARAMS)
+        ))
+        return "url:" + urlunsplit((scheme, host, path, query, ''))
+
+    @staticmethod
+    def bytes_key(data):
+        return "sha256:" + hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def vocabulary_hash(terms):
+        """stable hash of the skill vocabulary sent to the LLM"""
+        digest = hashlib.sha256()
+        for term in sorted({normalize_term(t) for t in terms}):
+            digest.update(term.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    @staticmethod
+    def _cache_key(resource_key, vocab_hash):
+        return hashlib.sha256(f"{resource_key}|{vocab_hash}".encode('utf-8')).hexdigest()
+
+    def _get(self, cache_key, now):
+        with self.db_manager.get_connection() as conn:
+            row = conn.execute(self.SELECT_ENTRY, (cache_key,)).fetchone()
+            if row is None:
+                return None
+            if now - row['created_at'] > self.ttl:
+                conn.execute(self.DELETE_ENTRY, (cache_key,))
+                conn.commit()
+                return None
+            conn.execute(self.TOUCH_ENTRY, (now, cache_key))
+            conn.commit()
+            return json.loads(row['keywords'])
+
+    async def get(self, resource_key, vocab_hash):
+        """cached keyword list, or None on a miss/expired entry"""
+        keywords = await self.db_manager.run(
+            self._get, self._cache_key(resource_key, vocab_hash), time.time()
+        )
+        if keywords is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return keywords
+
+    def _put(self, cache_key, resource_key, keywords, now, evict):
+        with self.db_manager.get_connection() as conn:
+            conn.execute(self.UPSERT_ENTRY, (cache_key, resource_key, json.dumps(keywords), now, now))
+            if evict:
+                conn.execute(self.DELETE_EXPIRED, (now - self.ttl,))
+                conn.execute(self.EVICT_LRU, (self.max_entries,))
+            conn.commit()
+
+    async def put(self, resource_key, vocab_hash, keywords):
+        # Eviction scans the LRU index, so only run it every so often
+        self._puts += 1
+        evict = self._puts % Config.CACHE_EVICT_EVERY == 0
+        await self.db_manager.run(
+            self._put, self._cache_key(resource_key, vocab_hash), resource_key,
+            list(keywords), time.time(), evict
+        )
+
+
+class Vocabulary:
+    """Skill vocabulary of a guild as handed to the analyzer
+
+    The prompt is the compact, sorted, comma separated term list, so every
+    skill appears once however many users registered it.
+    """
+    def __init__(self, counts, server_id=None):
+        self.server_id = server_id
+        self.counts = dict(counts)
+        self.terms = tuple(sorted(self.counts))
+        self.hash = ResultCache.vocabulary_hash(self.terms)
+        self.prompt = ", ".join(self.terms)
+
+
+class KeywordBatcher:
+    """Micro-batches LLM keyword requests per guild
+
+    Resources of one guild arriving within LLM_BATCH_WINDOW_MS of each other
+    are sent as one structured request (a KeywordBatch), sharing the system
+    prompt and vocabulary, and every caller gets its own keyword list back.
+    A batch is flushed early once it holds LLM_BATCH_MAX_SIZE resources or
+    would grow past LLM_BATCH_MAX_TOKENS.
+    """
+
+    def __init__(self, client, window_ms=None, max_size=None, max_tokens=None):
+        self.client = client
+        self.window = (window_ms if window_ms is not None else Config.LLM_BATCH_WINDOW_MS) / 1000
+        self.max_size = max_size or Config.LLM_BATCH_MAX_SIZE
+        self.max_tokens = max_tokens or Config.LLM_BATCH_MAX_TOKENS
+        self._pending = {}  # (server_id, vocabulary hash) -> open batch
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, kind, text, vocabulary):
+        """keywords of one resource, resolved when its batch comes back"""
+        loop = asyncio.get_running_loop()
+        key = (vocabulary.server_id, vocabulary.hash)
+        tokens = estimate_tokens(text)
+
+        batch = self._pending.get(key)
+        if batch is not None and batch['tokens'] + tokens > self.max_tokens:
+            self._flush(key)
+            batch = None
+        if batch is None:
+            batch = {
+                'vocabulary': vocabulary,
+                'items': [],
+                'tokens': 0,
+                'timer': loop.call_later(self.window, self._flush, key),
+            }
+            self._pending[key] = batch
+
+        future = loop.create_future()
+        batch['items'].append((kind, text, future))
+        batch['tokens'] += tokens
+        if len(batch['items']) >= self.max_size:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch['timer'].cancel()
+        task = asyncio.create_task(self._run(batch['vocabulary'], batch['items']))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, vocabulary, items):
+        self.batches += 1
+        self.items += len(items)
+        try:
+            results = await self._request(vocabulary, items)
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), keywords in zip(items, results):
+            if not future.done():
+                future.set_result(keywords)
+
+    @staticmethod
+    def batch_prompt(vocabulary, items):
+        resources = "\n\n".join(
+            f"### Resource {index} ({kind})\n{text}" for index, (kind, text, _) in enumerate(items)
+        )
+        return [
+            {
+                "role": "system",
+                "content": (
+                    "You are a technically skilled engineer. You are given several numbered resources (web pages or "
+                    "documents). For each resource, identify which skills or interests from a provided list are "
+                    "explicitly mentioned or can be reasonably inferred. Use only skills from the provided list and "
+                    "return one result per resource index, with an empty list when nothing matches."
+                )
+            },
+            {
+                "role": "user",
+                "content": (
+                    f"Here is the list of skills and interests available on the server:\n{vocabulary.prompt}\n\n"
+                    f"{resources}"
+                )
+            }
+        ]
+
+    async def _request(self, vocabulary, items):
+        response = await self.client.responses.parse(
+            model="gpt-5-mini",
+            input=self.batch_prompt(vocabulary, items),
+            text_format=KeywordBatch,
+        )
+        parsed = response.output_parsed
+        by_index = {result.resource_index: result.keyword_list for result in parsed.results} if parsed else {}
+        return [by_index.get(index, []) for index in range(len(items))]
+
+
+# Metrics
+class Counter:
+    """monotonic counter, one value per label combination"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """cumulative-bucket histogram, one series per label combination"""
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, help_text, labelnames=(), buckets=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets or self.DEFAULT_BUCKETS)
+        self.series = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        for key, (counts, total, count) in self.series.items():
+            labels = dict(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", {**labels, 'le': repr(float(bound))}, bucket_count
+            yield f"{self.name}_bucket", {**labels, 'le': '+Inf'}, count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class MetricsRegistry:
+    """Metrics rendered in the Prometheus text exposition format
+
+    Besides its own counters and histograms the registry takes collectors,
+    callables returning (name, kind, help, [(labels, value)]) tuples, so the
+    counters other components already keep are read at scrape time instead
+    of being counted twice. Only touched from the event loop thread.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=None):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    @staticmethod
+    def _format(name, labels, value):
+        if labels:
+            escaped = (
+                str(label_value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                for label_value in labels.values()
+            )
+            pairs = ",".join(f'{key}="{label_value}"' for key, label_value in zip(labels, escaped))
+            return f"{name}{{{pairs}}} {value}"
+        return f"{name} {value}"
+
+    def render(self):
+        lines = []
+        families = [(metric.name, metric.kind, metric.help, metric.samples()) for metric in self.metrics]
+        for collector in self.collectors:
+            for name, kind, help_text, samples in collector():
+                families.append((name, kind, help_text, [(name, labels, value) for labels, value in samples]))
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(self._format(*sample) for sample in samples)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves a registry on http://METRICS_HOST:METRICS_PORT/metrics"""
+    def __init__(self, registry, host=None, port=None):
+        self.registry = registry
+        self.host = host or Config.METRICS_HOST
+        self.port = port if port is not None else Config.METRICS_PORT
+        self.runner = None
+
+    async def handle_metrics(self, request):
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        logger.info(f"Metrics served on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+METRICS = MetricsRegistry()
+STAGE_SECONDS = METRICS.histogram(
+    'ozo_stage_seconds', 'Latency of resource pipeline stages', ('stage',)
+)
+RESOURCE_OUTCOMES = METRICS.counter(
+    'ozo_resources_total', 'Analyzed urls and attachments by outcome', ('kind', 'outcome')
+)
+SKIPPED_RESOURCES = METRICS.counter(
+    'ozo_skipped_resources_total', 'Resources skipped before analysis', ('reason',)
+)
+LLM_TOKENS = METRICS.counter(
+    'ozo_llm_tokens_total', 'LLM tokens used per guild', ('guild', 'direction')
+)
+# Guild the current task works for, read where LLM usage is recorded
+current_guild = contextvars.ContextVar('current_guild', default=None)
+# History record of the resource the current task analyzes
+current_resource = contextvars.ContextVar('current_resource', default=None)
+
+
+def note_resource(**fields):
+    """set fields of the current resource's history record, if there is one"""
+    resource = current_resource.get()
+    if resource is not None:
+        resource.update(fields)
+
+
+@contextmanager
+def timed_stage(stage):
+    """time a pipeline stage into STAGE_SECONDS and the current resource record"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        resource = current_resource.get()
+        if resource is not None:
+            timings = resource['timings']
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed, 4)
+
+
+# OpenAI rate limiting and circuit breaking
+class CircuitOpenError(Exception):
+    """raised instead of calling the LLM while the circuit breaker is open"""
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously up to per_minute tokens"""
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        # The lock keeps waiters in FIFO order instead of racing for refills
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures, probes again after reset_timeout"""
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = failure_threshold or Config.LLM_BREAKER_FAILURES
+        self.reset_timeout = reset_timeout or Config.LLM_BREAKER_RESET_SECONDS
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self):
+        if self.state == 'closed':
+            return True
+        if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = 'half_open'
+        if self.state == 'half_open' and not self._probing:
+            # Let a single request through to find out if the API is back
+            self._probing = True
+            return True
+        return False
+
+    def end_probe(self):
+        """let another call probe, the last one ended without an answer"""
+        self._probing = False
+
+    def record_success(self):
+        if self.state != 'closed':
+            logger.info("LLM circuit breaker closed")
+        self.state = 'closed'
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self, fatal=False):
+        """fatal failures (a bad API key) open the breaker right away"""
+        self.failures += 1
+        self._probing = False
+        if fatal or self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                logger.warning(f"LLM circuit breaker opened after {self.failures} failures")
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+
+
+class LLMGateway:
+    """Drop-in wrapper around AsyncOpenAI guarding every call
+
+    Exposes the same responses.create/parse and embeddings.create calls, but
+    each one first passes a circuit breaker and the requests/tokens per
+    minute buckets, and 429/5xx/connection errors are retried with jittered
+    exponential backoff. While the breaker is open calls fail fast with
+    CircuitOpenError so callers can fall back to local matching.
+    """
+
+    def __init__(self, client=None, client_factory=None):
+        self._client = client
+        self.client_factory = client_factory
+        self.request_bucket = TokenBucket(Config.LLM_REQUESTS_PER_MINUTE)
+        self.token_bucket = TokenBucket(Config.LLM_TOKENS_PER_MINUTE)
+        self.breaker = CircuitBreaker()
+        self.responses = SimpleNamespace(
+            create=self._guarded(lambda: self.client.responses.create),
+            parse=self._guarded(lambda: self.client.responses.parse),
+        )
+        self.embeddings = SimpleNamespace(
+            create=self._guarded(lambda: self.client.embeddings.create),
+        )
+        self.retries = 0
+        self.rejected = 0
+
+    @property
+    def client(self):
+        """the wrapped client, built by client_factory on first use"""
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def _guarded(self, method):
+        async def call(**kwargs):
+            return await self.call(method(), **kwargs)
+        return call
+
+    @staticmethod
+    def estimate_request_tokens(kwargs):
+        payload = kwargs.get('input', '')
+        if isinstance(payload, str):
+            texts = [payload]
+        else:
+            texts = [item['content'] if isinstance(item, dict) else str(item) for item in payload]
+        # Plus a rough allowance for the completion
+        return sum(estimate_tokens(text) for text in texts) + 256
+
+    @staticmethod
+    def is_auth_error(error):
+        import openai
+        return isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError))
+
+    @staticmethod
+    def is_retryable(error):
+        import openai
+        if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+            return True
+        status = getattr(error, 'status_code', None)
+        return status is not None and status >= 500
+
+    async def call(self, func, **kwargs):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+        # Only this call may probe a half open breaker; if it is cancelled
+        # before an answer the probe has to be handed back
+        probe = self.breaker.state == 'half_open'
+        try:
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(self.estimate_request_tokens(kwargs))
+
+            for attempt in range(Config.LLM_MAX_RETRIES + 1):
+                try:
+                    with timed_stage('llm'):
+                        result = await func(**kwargs)
+                except Exception as e:
+                    if self.is_auth_error(e):
+                        # A revoked or invalid key fails every call the same way
+                        self.breaker.record_failure(fatal=True)
+                        raise
+                    if not self.is_retryable(e):
+                        # The API answered, it's the request that's wrong
+                        self.breaker.record_success()
+                        raise
+                    if attempt == Config.LLM_MAX_RETRIES:
+                        self.breaker.record_failure()
+                        raise
+                    delay = min(Config.LLM_RETRY_MAX_SECONDS, Config.LLM_RETRY_BASE_SECONDS * 2 ** attempt)
+                    self.retries += 1
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                else:
+                    self.breaker.record_success()
+                    self.record_usage(result)
+                    return result
+        finally:
+            if probe:
+                self.breaker.end_probe()
+
+    @staticmethod
+    def record_usage(result):
+        usage = getattr(result, 'usage', None)
+        if usage is None:
+            return
+        guild = current_guild.get()
+        # responses report input/output tokens, embeddings prompt tokens only
+        input_tokens = getattr(usage, 'input_tokens', None) or getattr(usage, 'prompt_tokens', 0) or 0
+        output_tokens = getattr(usage, 'output_tokens', 0) or 0
+        LLM_TOKENS.inc(input_tokens, guild=guild, direction='input')
+        if output_tokens:
+            LLM_TOKENS.inc(output_tokens, guild=guild, direction='output')
+
+
+# Resource Analyzer
+class ResourceAnalyzer:
+    """core discord logic"""
+    client = LLMGateway(client_factory=make_openai_client)
+
+    HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.session = None
+        self.document_pool = None
+        # One job per worker at a time, so a job's timeout only runs while it is parsed
+        self.document_slots = asyncio.Semaphore(Config.DOCUMENT_WORKERS)
+        self._matchers = OrderedDict()  # vocabulary hash -> SkillMatcher
+        self._inflight = {}  # (resource key, vocabulary hash) -> analysis task
+        self.batcher = KeywordBatcher(ResourceAnalyzer.client) if Config.LLM_BATCHING else None
+        self.prefilter_stats = {'skipped': 0, 'exact': 0, 'llm': 0, 'fallback': 0}
+
+    def start_document_pool(self):
+        # spawn, not fork: the bot process already runs db and event loop threads
+        self.document_pool = ProcessPoolExecutor(
+            max_workers=Config.DOCUMENT_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def restart_document_pool(self, pool):
+        """Kill the workers of pool and start a new one, unless that already happened
+
+        A parser stuck on a malformed file never returns, and a pool job can't
+        be cancelled once it runs, only its process can be terminated. Other
+        jobs running in the pool fail and are retried on a later message.
+        """
+        if self.document_pool is not pool:
+            return
+        self.document_pool = None
+        # ProcessPoolExecutor has no public way to stop a running job
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.start_document_pool()
+
+    async def start(self):
+        """Create the bot-lifetime HTTP session and the document process pool"""
+        if self.document_pool is None:
+            self.start_document_pool()
+        if self.session is not None:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=Config.HTTP_POOL_SIZE,
+            limit_per_host=Config.HTTP_POOL_PER_HOST,
+            ttl_dns_cache=Config.HTTP_DNS_CACHE_SECONDS,
+            keepalive_timeout=30
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=Config.HTTP_TOTAL_TIMEOUT,
+            sock_connect=Config.HTTP_CONNECT_TIMEOUT,
+            sock_read=Config.HTTP_READ_TIMEOUT
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={'User-Agent': 'OzoBot/1.0 (+https://discord.com)'}
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.document_pool is not None:
+            self.document_pool.shutdown(wait=False, cancel_futures=True)
+            self.document_pool = None
+
+    @classmethod
+    async def fetch_html(cls, session, url, max_bytes=None):
+        """Stream an HTML page, giving up early on other content-types
 
+        The body is read in chunks and cut at max_bytes, so a huge page costs
+        at most the cap instead of its full size.
+        """
+        max_bytes = max_bytes or Config.MAX_PAGE_BYTES
+        async with session.get(url) as response:
+            response.raise_for_status()
+            if response.content_type not in cls.HTML_CONTENT_TYPES:
+                SKIPPED_RESOURCES.inc(reason='content_type')
+                raise ResourceFetchError(f"unsupported content-type {response.content_type}")
 
-# Resource Analyzer
-class ResourceAnalyzer:
-    """core discord logic"""
-    client = AsyncOpenAI(
-                api_key = api_key
-            )
-    @staticmethod
-    async def extract_text_from_document(attachment):
-        """Extract text from document attachments"""
+            chunks = []
+            size = 0
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= max_bytes:
+                    break
+            body = b"".join(chunks)[:max_bytes]
+            return body.decode(response.charset or 'utf-8', errors='replace')
+
+    async def extract_text_from_document(self, attachment, file_bytes=None):
+        """Extract text from document attachments in the document process pool"""
         try:
-            file_bytes = await attachment.read()
-            file_stream = io.BytesIO(file_bytes)
-            
-            if attachment.filename.lower().endswith('.pdf'):
-                pdf_reader = PyPDF2.PdfReader(file_stream)
-                text = ""
-                for page in pdf_reader.pages:  # Limit to first 5 pages
-                    text += page.extract_text()
-                return text[:300000]  # Limit characters
-            
-            elif attachment.filename.lower().endswith(('.docx', '.doc')):
-                doc = docx.Document(file_stream)
-                text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-                return text[:300000]
-            
-            elif attachment.filename.lower().endswith(('.txt', '.md')):
-                return file_bytes.decode('utf-8', errors='ignore')[:300000]
-            
+            if file_bytes is None:
+                file_bytes = await attachment.read()
+            if self.document_pool is None:
+                self.start_document_pool()
+
+            loop = asyncio.get_running_loop()
+            async with self.document_slots:
+                pool = self.document_pool
+                job = loop.run_in_executor(
+                    pool, parse_document, attachment.filename, file_bytes,
+                    Config.MAX_DOCUMENT_PAGES, Config.MAX_DOCUMENT_CHARS
+                )
+                try:
+                    with timed_stage('parse'):
+                        return await asyncio.wait_for(job, timeout=Config.DOCUMENT_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Timed out extracting text from {attachment.filename}, restarting the document pool")
+                    self.restart_document_pool(pool)
+                    return None
+                except BrokenProcessPool as e:
+                    logger.error(f"Document pool broke while extracting {attachment.filename}: {e}")
+                    self.restart_document_pool(pool)
+                    return None
         except Exception as e:
             logger.error(f"Error extracting text from document: {e}")
             return None
@@ -280,44 +2110,46 @@ class ResourceAnalyzer:
             
             result = response.output_text
             output = result.split(',')
-            print(f"-----> this is the doc output {output}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"document keywords={output}")
             # result = list(result.keyword_list)
             return output
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Error checking relevance: {e}")
             return ""
     
 
     @staticmethod
-    async def get_web_content(url:str, master_keyword):
-        """ this is to get web content """
+    def web_prompt(page_text, master_keyword):
+        """prompt asking which skills a web page's extracted text covers"""
+        return [
+            {
+                "role": "system",
+                "content": (
+                    "You are a technically skilled engineer. Your task is to analyze the given web page text and identify "
+                    "which skills or interests from a provided list are explicitly present or can be reasonably inferred "
+                    "from the page. Focus on relevant technical and domain-specific keywords. "
+                    "Return only the matching skills from the provided list."
+                )
+            },
+            {
+                "role": "user",
+                "content": (
+                    f"The following is the web page content:\n\n{page_text}\n\n"
+                    f"Here is the list of skills and interests to compare against:\n{master_keyword}\n\n"
+                    "Return only the matched skills as plain text seperated by commas Do not include explanations."
+                )
+            }
+        ]
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                content = await response.text()
-        soup = BeautifulSoup(content , "html.parser")
+    @staticmethod
+    async def check_web_similarity(page_text, master_keyword):
+        """Ask the LLM which skills a web page covers"""
         response = await ResourceAnalyzer.client.responses.create(
             model="gpt-5-mini",
-            input=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a technically skilled engineer. Your task is to analyze the given HTML content and identify "
-                        "which skills or interests from a provided list are explicitly present or can be reasonably inferred "
-                        "from the HTML. Focus on relevant technical and domain-specific keywords. "
-                        "Return only the matching skills from the provided list."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        f"The following is the HTML content:\n\n{soup.prettify()}\n\n"
-                        f"Here is the list of skills and interests to compare against:\n{master_keyword}\n\n"
-                        "Return only the matched skills as plain text seperated by commas Do not include explanations."
-                    )
-                }
-            ],
-
+            input=ResourceAnalyzer.web_prompt(page_text, master_keyword),
         ) # type: ignore
         output_keyword = response.output_text
         output = output_keyword.split(',')
@@ -325,37 +2157,445 @@ class ResourceAnalyzer:
         # output = list(output_keyword.keyword_list)
         return output
 
+    async def get_web_content(self, url:str):
+        """ this is to get web content """
 
-    
-    @staticmethod
-    async def match_users_to_resource( users_data, keyword_list):
-        """Match users to resource using GPT"""
+        if self.session is None:
+            await self.start()
+        with timed_stage('fetch'):
+            content = await self.fetch_html(self.session, url)
+        # Parsing is CPU bound, keep it off the event loop thread
+        with timed_stage('parse'):
+            return await asyncio.to_thread(extract_page_text, content)
+
+    def matcher_for(self, vocabulary):
+        """compiled SkillMatcher of a vocabulary, reused while it doesn't change"""
+        matcher = self._matchers.get(vocabulary.hash)
+        if matcher is None:
+            matcher = SkillMatcher(vocabulary.terms)
+            self._matchers[vocabulary.hash] = matcher
+            if len(self._matchers) > Config.MATCHER_CACHE_SIZE:
+                self._matchers.popitem(last=False)
+        else:
+            self._matchers.move_to_end(vocabulary.hash)
+        return matcher
+
+    async def ask_llm(self, kind, text, vocabulary):
+        """LLM keywords for one resource, batched with others when batching is on"""
+        if self.batcher is not None:
+            return await self.batcher.submit(kind, text, vocabulary)
+        if kind == 'document':
+            return await self.check_document_similarity(text, vocabulary.prompt)
+        return await self.check_web_similarity(text, vocabulary.prompt)
+
+    async def classify_text(self, text, vocabulary, kind):
+        """Keywords of extracted text, only asking the LLM about ambiguous cases
+
+        The local matcher runs first: text with no candidate term at all is
+        skipped, exact term hits are kept as they are, and the LLM is only
+        asked when stems/synonyms left other candidate terms, its answer
+        being merged with the exact hits. Returns (keywords, cacheable);
+        degraded or failed answers aren't cacheable.
+        """
+        matcher = self.matcher_for(vocabulary)
+        exact, candidates = await asyncio.to_thread(matcher.scan, text)
+        if not candidates:
+            self.prefilter_stats['exact' if exact else 'skipped'] += 1
+            return sorted(exact), True
+
+        self.prefilter_stats['llm'] += 1
         try:
-            matched_user_ids = []
-            users_profiles = {}
-            for user in users_data:
-                users_profiles[user['discord_id']] =  user['skills'].lower(),
-            
-            for matched_skill in keyword_list:
-                print(f"matched skills {matched_skill}")
-                for user, skill in users_profiles.items():
-                    # print(f"skill is here {skill} --- type {type(skill)}")
-                    skill = skill[0].split(',')
+            if estimate_tokens(text) > Config.MAX_DOCUMENT_TOKENS:
+                keywords = await self.analyze_chunks(kind, text, vocabulary)
+            else:
+                keywords = await self.ask_llm(kind, text, vocabulary)
+        except CircuitOpenError:
+            # LLM unavailable, the local candidates are the best guess we have
+            self.prefilter_stats['fallback'] += 1
+            return sorted(exact | candidates), False
+        if keywords == "":
+            # The LLM call failed, don't remember that as "no keywords"
+            return sorted(exact), False
+        return list(dict.fromkeys([*sorted(exact), *keywords])), True
+
+    async def analyze_chunks(self, kind, text, vocabulary):
+        """Map-reduce the LLM over token-budgeted chunks of a long text
+
+        Chunks of Config.MAX_DOCUMENT_TOKENS without any candidate term are
+        never sent. The rest are analyzed with bounded parallelism and their
+        keyword sets merged, stopping early once every vocabulary term was
+        found or MAX_DOCUMENT_TOTAL_TOKENS worth of chunks were sent.
+        """
+        started = time.perf_counter()
+        matcher = self.matcher_for(vocabulary)
+        chunks = chunk_text(text, Config.MAX_DOCUMENT_TOKENS)
+        scans = await asyncio.to_thread(lambda: [matcher.scan(chunk) for chunk in chunks])
+        relevant = [chunk for chunk, (exact, candidates) in zip(chunks, scans) if exact or candidates]
 
-                    for x in skill:
-                        x = x.strip()
-                    print(f"-- if condition {matched_skill.lower()} ---- skill {skill} -----> if condition {matched_skill.lower() in list(skill)}")
-                    if (matched_skill.lower()) in list(skill):
-                        matched_user_ids.append(user)
+        wanted = set(vocabulary.terms)
+        found = set()
+        accounting = {'calls': 0, 'tokens': 0, 'failed': 0}
+        semaphore = asyncio.Semaphore(Config.CHUNK_CONCURRENCY)
+        finished = asyncio.Event()
 
+        async def analyze_chunk(chunk):
+            async with semaphore:
+                if finished.is_set():
+                    return
+                tokens = estimate_tokens(chunk)
+                if accounting['tokens'] + tokens > Config.MAX_DOCUMENT_TOTAL_TOKENS:
+                    finished.set()
+                    return
+                accounting['tokens'] += tokens
+                accounting['calls'] += 1
+                keywords = await self.ask_llm(kind, chunk, vocabulary)
+                if keywords == "":
+                    accounting['failed'] += 1
+                    return
+                found.update(term for term in map(normalize_term, keywords) if term)
+                if wanted <= found:
+                    finished.set()
 
-            print(f"matched pairs {matched_user_ids}")
-            return matched_user_ids
+        results = await asyncio.gather(*(analyze_chunk(chunk) for chunk in relevant), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for error in errors:
+            if isinstance(error, CircuitOpenError):
+                raise error
+        accounting['failed'] += len(errors)
+
+        logger.info(
+            f"Analyzed {kind}: {len(chunks)} chunks, {len(relevant)} relevant, "
+            f"{accounting['calls']} LLM calls, ~{accounting['tokens']} input tokens, "
+            f"{accounting['failed']} failed, {len(found)} keywords in {time.perf_counter() - started:.2f}s"
+        )
+        if accounting['failed'] and not found:
+            return ""
+        return sorted(found)
+
+    async def local_keywords(self, text, vocabulary):
+        """every vocabulary term the local matcher finds, exact or candidate"""
+        exact, candidates = await asyncio.to_thread(self.matcher_for(vocabulary).scan, text)
+        return sorted(exact | candidates)
+
+    async def single_flight(self, key, factory):
+        """Run factory() once for all concurrent callers asking for the same key"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+
+            def done(finished):
+                self._inflight.pop(key, None)
+                if not finished.cancelled():
+                    finished.exception()  # retrieved even if every caller gave up
+
+            task.add_done_callback(done)
+        # Shielded so one caller timing out doesn't cancel it for the others
+        return await asyncio.shield(task)
+
+    async def _cached_analysis(self, resource_key, vocabulary, analyze):
+        if self.cache:
+            cached = await self.cache.get(resource_key, vocabulary.hash)
+            if cached is not None:
+                note_resource(cache_hit=True)
+                return cached
+
+        keywords, cacheable = await analyze()
+        if cacheable and self.cache:
+            await self.cache.put(resource_key, vocabulary.hash, keywords)
+        return keywords
+
+    async def analyze_url(self, url, vocabulary):
+        """Keywords for a url, served from the result cache for reposts"""
+        resource_key = ResultCache.url_key(url)
+        note_resource(resource_key=resource_key)
+
+        async def analyze():
+            page_text = await self.get_web_content(url)
+            return await self.classify_text(page_text, vocabulary, 'web page')
+
+        return await self.single_flight(
+            (resource_key, vocabulary.hash),
+            lambda: self._cached_analysis(resource_key, vocabulary, analyze)
+        )
+
+    @staticmethod
+    async def read_attachment(attachment):
+        """attachment bytes, or None when it is over the size limit"""
+        if attachment.size > Config.MAX_ATTACHMENT_BYTES:
+            logger.info(f"Skipping {attachment.filename}: {attachment.size} bytes is over the size limit")
+            SKIPPED_RESOURCES.inc(reason='too_large')
+            return None
+        with timed_stage('fetch'):
+            return await attachment.read()
+
+    async def attachment_text(self, attachment):
+        """extracted text of a document attachment"""
+        file_bytes = await self.read_attachment(attachment)
+        if file_bytes is None:
+            return None
+        return await self.extract_text_from_document(attachment, file_bytes)
+
+    async def analyze_attachment(self, attachment, vocabulary):
+        """Keywords for a document attachment, cached by the hash of its bytes"""
+        file_bytes = await self.read_attachment(attachment)
+        if file_bytes is None:
+            return []
+        resource_key = ResultCache.bytes_key(file_bytes)
+        note_resource(resource_key=resource_key)
+
+        async def analyze():
+            text = await self.extract_text_from_document(attachment, file_bytes)
+            if text is None:
+                # Timed out or failed to parse, worth another try next time
+                return [], False
+            if not text:
+                return [], True
+            return await self.classify_text(text, vocabulary, 'document')
+
+        return await self.single_flight(
+            (resource_key, vocabulary.hash),
+            lambda: self._cached_analysis(resource_key, vocabulary, analyze)
+        )
+
+
+    
+    @staticmethod
+    async def match_users_to_resource(skill_index, server_id, keyword_list):
+        """Match users to resource keywords with one index lookup per keyword
+
+        Returns {discord_id: number of matched keywords}.
+        """
+        try:
+            with timed_stage('match'):
+                matches = skill_index.lookup(server_id, keyword_list)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"guild={server_id} keywords={keyword_list} matched_users={len(matches)}")
+            return matches
         except Exception as e:
             logger.error(f"Error matching users: {e}")
-            return []
+            return {}
+
+
 
 
+# Embedding matching
+class LocalEmbedder:
+    """Offline stand-in for the embedding API
+
+    Hashes word stems, synonym expansions and character trigrams into a fixed
+    size vector. Much weaker than a real model, but deterministic and free,
+    which is enough to run the embedding match mode in tests and benchmarks.
+    """
+    def __init__(self, dim=None):
+        load_numpy()
+        self.dim = dim or Config.LOCAL_EMBEDDING_DIM
+        self.name = f"local-hash-{self.dim}"
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        features = []  # (feature, weight)
+        for word in SkillMatcher.tokenize(text):
+            stem = SkillMatcher.stem(word)
+            features.append((stem, 3.0))
+            expanded = SKILL_SYNONYMS.get(word)
+            if expanded:
+                features.extend((SkillMatcher.stem(part), 3.0) for part in expanded.split())
+            padded = f"#{stem}#"
+            features.extend((padded[i:i + 3], 1.0) for i in range(len(padded) - 2))
+
+        for feature, weight in features:
+            # crc32, not hash(): vectors are stored and must survive restarts
+            bucket = zlib.crc32(feature.encode('utf-8'))
+            vector[bucket % self.dim] += weight if bucket & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def embed(self, texts):
+        return await asyncio.to_thread(lambda: [self._vector(text) for text in texts])
+
+
+class OpenAIEmbedder:
+    """Embeddings from the OpenAI embeddings endpoint"""
+    def __init__(self, client, model=None):
+        load_numpy()
+        self.client = client
+        self.name = model or Config.EMBEDDING_MODEL
+
+    async def embed(self, texts):
+        response = await self.client.embeddings.create(model=self.name, input=list(texts))
+        vectors = [np.asarray(item.embedding, dtype=np.float32) for item in response.data]
+        return [vector / (np.linalg.norm(vector) or 1.0) for vector in vectors]
+
+
+class EmbeddingMatcher:
+    """Semantic matching of resource text against user profile embeddings
+
+    Each user's job title, skills and interests are embedded once and cached
+    in user_embeddings (refreshed from save_user). A guild's profiles are
+    held as one contiguous float32 matrix, so scoring a resource is a single
+    matrix-vector product followed by a threshold and top-k cut.
+    """
+
+    SELECT_PROFILES = '''
+        SELECT u.discord_id, u.job_title, u.skills, u.interests, e.vector
+        FROM users u
+        LEFT JOIN user_embeddings e
+            ON e.discord_id = u.discord_id AND e.model = ? AND e.updated_at >= u.updated_at
+        WHERE u.server_id = ?
+    '''
+    SELECT_PROFILE = '''
+        SELECT u.discord_id, u.server_id, u.job_title, u.skills, u.interests, e.vector
+        FROM users u
+        LEFT JOIN user_embeddings e
+            ON e.discord_id = u.discord_id AND e.model = ? AND e.updated_at >= u.updated_at
+        WHERE u.discord_id = ?
+    '''
+    UPSERT_EMBEDDING = '''
+        INSERT INTO user_embeddings (discord_id, server_id, model, vector, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(discord_id) DO UPDATE SET
+            server_id = excluded.server_id,
+            model = excluded.model,
+            vector = excluded.vector,
+            updated_at = CURRENT_TIMESTAMP
+    '''
+
+    def __init__(self, db_manager, embedder, top_k=None, threshold=None):
+        try:
+            load_numpy()
+        except ImportError:
+            raise RuntimeError("MATCH_MODE=embedding needs numpy installed")
+        self.db_manager = db_manager
+        self.embedder = embedder
+        self.top_k = top_k or Config.EMBEDDING_TOP_K
+        self.threshold = threshold if threshold is not None else Config.EMBEDDING_THRESHOLD
+        self._guilds = {}  # server_id -> (ids int64 array, float32 matrix)
+        self._locks = {}
+
+    @staticmethod
+    def profile_text(job_title, skills, interests):
+        return f"{job_title or ''}. Skills: {skills or ''}. Interests: {interests or ''}"
+
+    def _lock(self, server_id):
+        return self._locks.setdefault(server_id, asyncio.Lock())
+
+    def _load_profiles(self, server_id):
+        with self.db_manager.get_connection() as conn:
+            return conn.execute(self.SELECT_PROFILES, (self.embedder.name, server_id)).fetchall()
+
+    def _load_profile(self, discord_id):
+        with self.db_manager.get_connection() as conn:
+            return conn.execute(self.SELECT_PROFILE, (self.embedder.name, discord_id)).fetchone()
+
+    def _store(self, rows):
+        with self.db_manager.get_connection() as conn:
+            conn.executemany(self.UPSERT_EMBEDDING, rows)
+            conn.commit()
+
+    async def ensure_guild(self, server_id):
+        """Load (embedding any missing/stale profiles) the matrix of a guild"""
+        entry = self._guilds.get(server_id)
+        if entry is not None:
+            return entry
+
+        async with self._lock(server_id):
+            entry = self._guilds.get(server_id)
+            if entry is not None:
+                return entry
+
+            ids, vectors, missing = [], [], []
+            for row in await self.db_manager.run(self._load_profiles, server_id):
+                if row['vector'] is None:
+                    missing.append(row)
+                else:
+                    ids.append(row['discord_id'])
+                    vectors.append(np.frombuffer(row['vector'], dtype=np.float32))
+
+            for start in range(0, len(missing), Config.EMBEDDING_BATCH_SIZE):
+                batch = missing[start:start + Config.EMBEDDING_BATCH_SIZE]
+                embedded = await self.embedder.embed([
+                    self.profile_text(row['job_title'], row['skills'], row['interests']) for row in batch
+                ])
+                await self.db_manager.run(self._store, [
+                    (row['discord_id'], server_id, self.embedder.name, vector.tobytes())
+                    for row, vector in zip(batch, embedded)
+                ])
+                ids.extend(row['discord_id'] for row in batch)
+                vectors.extend(embedded)
+
+            if vectors:
+                matrix = np.ascontiguousarray(np.vstack(vectors), dtype=np.float32)
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            entry = (np.asarray(ids, dtype=np.int64), matrix)
+            self._guilds[server_id] = entry
+            return entry
+
+    def _is_loaded(self, discord_id, server_id):
+        return server_id in self._guilds or any((ids == discord_id).any() for ids, _ in self._guilds.values())
+
+    async def on_guild_changed(self, kind, server_id, discord_id=None):
+        """Another process changed a profile: patch its vector in, or reload a whole changed guild"""
+        if kind != 'profile':
+            return
+        if discord_id is None:
+            self._guilds.pop(server_id, None)
+            return
+        row = await self.db_manager.run(self._load_profile, discord_id)
+        if row is None or not self._is_loaded(discord_id, row['server_id']):
+            return
+        if row['vector'] is None:
+            # Saved, but not embedded yet by the process that saved it
+            await self.on_profile_saved(dict(row))
+        else:
+            await self._patch(discord_id, row['server_id'], np.frombuffer(row['vector'], dtype=np.float32))
+
+    async def on_profile_saved(self, profile):
+        """Re-embed a saved profile and patch the loaded matrices in place"""
+        discord_id = profile['discord_id']
+        server_id = profile['server_id']
+        text = self.profile_text(profile['job_title'], profile['skills'], profile['interests'])
+        vector = (await self.embedder.embed([text]))[0]
+        await self.db_manager.run(
+            self._store, [(discord_id, server_id, self.embedder.name, vector.tobytes())]
+        )
+        await self._patch(discord_id, server_id, vector)
+
+    async def _patch(self, discord_id, server_id, vector):
+        """put the vector of one profile into the loaded matrices"""
+        # A user moving servers leaves the matrix of the old one
+        for other_id, (ids, matrix) in list(self._guilds.items()):
+            if other_id != server_id and (ids == discord_id).any():
+                keep = ids != discord_id
+                self._guilds[other_id] = (ids[keep], np.ascontiguousarray(matrix[keep]))
+
+        async with self._lock(server_id):
+            entry = self._guilds.get(server_id)
+            if entry is None:
+                return
+            ids, matrix = entry
+            rows = np.flatnonzero(ids == discord_id)
+            if rows.size:
+                matrix[rows[0]] = vector
+            elif matrix.size:
+                self._guilds[server_id] = (np.append(ids, discord_id), np.ascontiguousarray(np.vstack([matrix, vector])))
+            else:
+                self._guilds[server_id] = (np.asarray([discord_id], dtype=np.int64), vector[None, :].copy())
+
+    async def match(self, server_id, text):
+        """{discord_id: cosine score} of the top-k profiles above the threshold"""
+        ids, matrix = await self.ensure_guild(server_id)
+        if not len(ids):
+            return {}
+
+        query = (await self.embedder.embed([truncate_to_tokens(text, Config.EMBEDDING_MAX_TOKENS)]))[0]
+        with timed_stage('match'):
+            scores = matrix @ query
+            hits = np.flatnonzero(scores >= self.threshold)
+            if hits.size > self.top_k:
+                hits = hits[np.argpartition(scores[hits], -self.top_k)[-self.top_k:]]
+        return {int(ids[i]): float(scores[i]) for i in hits}
 
 
 # Registration Modal
@@ -390,7 +2630,7 @@ class RegistrationModal(discord.ui.Modal, title='Profile Registration'):
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer()
         
-        self.db_manager.save_user(
+        await self.db_manager.save_user(
             discord_id=interaction.user.id,
             discord_username=str(interaction.user),
             server_id=interaction.guild_id,
@@ -412,115 +2652,751 @@ class RegistrationModal(discord.ui.Modal, title='Profile Registration'):
 
 
 
+# Resource history
+class ResourceRecorder:
+    """Write-behind log of analyzed resources into the resources table
+
+    record() only appends to an in-memory buffer. The buffer is written with
+    one executemany per transaction once it holds RESOURCE_FLUSH_SIZE rows
+    or every RESOURCE_FLUSH_SECONDS, so the message path never waits on a
+    history insert. A maintenance pass deletes rows past the retention
+    period and compacts older ones down to the columns /stats needs.
+    """
+
+    INSERT_RESOURCE = '''
+        INSERT INTO resources (server_id, message_id, resource_type, resource_url, resource_key,
+                               keywords, tagged_users, tagged_count, cache_hit, timings, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    # Bounded chunks so the maintenance pass never holds the write lock for long
+    DELETE_EXPIRED = '''
+        DELETE FROM resources WHERE id IN (
+            SELECT id FROM resources WHERE created_at < ? LIMIT 5000
+        )
+    '''
+    COMPACT_OLD = '''
+        UPDATE resources SET keywords = NULL, tagged_users = NULL, timings = NULL
+        WHERE id IN (
+            SELECT id FROM resources WHERE created_at < ? AND timings IS NOT NULL LIMIT 5000
+        )
+    '''
+
+    def __init__(self, db_manager, flush_size=None, flush_seconds=None, buffer_max=None):
+        self.db_manager = db_manager
+        self.flush_size = flush_size or Config.RESOURCE_FLUSH_SIZE
+        self.flush_seconds = flush_seconds or Config.RESOURCE_FLUSH_SECONDS
+        self.buffer_max = buffer_max or Config.RESOURCE_BUFFER_MAX
+        self._buffer = []
+        self._flush_lock = None
+        self._tasks = set()
+        self._loop_task = None
+        self.written = 0
+        self.dropped = 0
+
+    @staticmethod
+    def timestamp(seconds_ago=0):
+        # Same text format (UTC) as CURRENT_TIMESTAMP, so both compare as strings
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - seconds_ago))
+
+    def record(self, server_id, message_id, resource, tagged_users):
+        """buffer the history row of one analyzed resource"""
+        keywords = resource['keywords']
+        self._buffer.append((
+            server_id,
+            message_id,
+            resource['kind'],
+            resource['name'],
+            resource['resource_key'],
+            json.dumps(keywords) if keywords is not None else None,
+            json.dumps(tagged_users),
+            len(tagged_users),
+            int(resource['cache_hit']),
+            json.dumps(resource['timings']),
+            self.timestamp(),
+        ))
+        if len(self._buffer) > self.buffer_max:
+            # The database is falling behind, history is the first thing to give
+            del self._buffer[0]
+            self.dropped += 1
+        if len(self._buffer) >= self.flush_size:
+            task = asyncio.create_task(self.flush())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _insert(self, rows):
+        with self.db_manager.get_connection() as conn:
+            conn.executemany(self.INSERT_RESOURCE, rows)
+            conn.commit()
+
+    async def flush(self):
+        """write everything buffered so far in one transaction"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            rows, self._buffer = self._buffer, []
+            if not rows:
+                return
+            try:
+                await self.db_manager.run(self._insert, rows)
+                self.written += len(rows)
+            except Exception as e:
+                self.dropped += len(rows)
+                logger.error(f"Error writing {len(rows)} resource history rows: {e}")
+
+    def _maintain(self):
+        deleted = compacted = 0
+        expired = self.timestamp(Config.RESOURCE_RETENTION_DAYS * 86400)
+        old = self.timestamp(Config.RESOURCE_COMPACT_DAYS * 86400)
+        with self.db_manager.get_connection() as conn:
+            for statement, cutoff in ((self.DELETE_EXPIRED, expired), (self.COMPACT_OLD, old)):
+                while True:
+                    changed = conn.execute(statement, (cutoff,)).rowcount
+                    conn.commit()
+                    if statement is self.DELETE_EXPIRED:
+                        deleted += changed
+                    else:
+                        compacted += changed
+                    if changed < 5000:
+                        break
+        return deleted, compacted
+
+    async def maintain(self):
+        """Apply retention: delete expired rows, strip the details of old ones"""
+        deleted, compacted = await self.db_manager.run(self._maintain)
+        if deleted or compacted:
+            logger.info(f"Resource history maintenance: {deleted} rows deleted, {compacted} compacted")
+
+    def start(self):
+        self._flush_lock = asyncio.Lock()
+        self._loop_task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        last_maintenance = 0.0
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+                if time.monotonic() - last_maintenance >= Config.RESOURCE_MAINTENANCE_SECONDS:
+                    last_maintenance = time.monotonic()
+                    await self.maintain()
+            except Exception as e:
+                logger.error(f"Error in resource history writer: {e}")
+
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+
+
+# Mention rendering
+class MentionRenderer:
+    """Turns {discord_id: score} into as few embed replies as Discord allows
+
+    Matches are ranked by score and capped at MAX_MENTIONS. Membership is
+    checked against the member cache (MEMBER_CACHE=full), a bounded LRU of
+    ids known to be in the guild or not (lean) or not at all (raw), and ids missing from
+    it are requested in chunks of 100 instead of one fetch per user. A
+    mention only needs the id, so no Member object is kept. Mentions are packed into
+    fields of at most 1024 characters, fields into embeds, and embeds into
+    messages that stay under 6000 characters and 10 embeds each, so a large
+    match set becomes a few replies instead of one that Discord rejects.
+    """
+
+    FIELD_CHARS = 1024
+    MESSAGE_CHARS = 6000
+    FIELDS_PER_EMBED = 25
+    EMBEDS_PER_MESSAGE = 10
+    QUERY_CHUNK = 100
+    # Left free in every message for the title, description and footer
+    RESERVED_CHARS = 300
+
+    TITLE = "📚 Relevant Resource Detected"
+    FOOTER = "This resource matches your profile interests/skills"
+
+    def __init__(self, max_mentions=None, max_messages=None, mode=None, lru_size=None):
+        self.max_mentions = max_mentions or Config.MAX_MENTIONS
+        self.max_messages = max_messages or Config.MAX_MENTION_MESSAGES
+        self.mode = mode or Config.MEMBER_CACHE
+        self.lru_size = lru_size or Config.MEMBER_LRU_SIZE
+        self._known = OrderedDict()  # (guild_id, user_id) -> is a member, lean mode
+
+    def remember(self, guild_id, user_id, is_member):
+        key = (guild_id, user_id)
+        self._known[key] = is_member
+        self._known.move_to_end(key)
+        if len(self._known) > self.lru_size:
+            self._known.popitem(last=False)
+
+    def forget(self, guild_id, user_id):
+        """a member joined or left, look them up again next time"""
+        self._known.pop((guild_id, user_id), None)
+
+    @staticmethod
+    def rank(scores):
+        """user ids by descending score, ties broken by id for stable output"""
+        return sorted(scores, key=lambda user_id: (-scores[user_id], user_id))
+
+    async def resolve(self, guild, user_ids):
+        """ids of user_ids still in the guild, in the same order"""
+        user_ids = [int(user_id) for user_id in user_ids]
+        if self.mode == 'raw':
+            return user_ids
+
+        found = set()
+        missing = []
+        # With the full cache a chunked guild holds every member, so a
+        # cache miss means they left and there is nothing to query
+        complete = self.mode == 'full' and guild.chunked
+        for user_id in user_ids:
+            known = self._known.get((guild.id, user_id))
+            if known is not None:
+                self._known.move_to_end((guild.id, user_id))
+                if known:
+                    found.add(user_id)
+            elif guild.get_member(user_id) is not None:
+                found.add(user_id)
+            elif not complete:
+                missing.append(user_id)
+
+        for start in range(0, len(missing), self.QUERY_CHUNK):
+            chunk = missing[start:start + self.QUERY_CHUNK]
+            try:
+                # Only the full cache mode keeps the fetched Member objects
+                fetched = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=self.mode == 'full')
+            except (asyncio.TimeoutError, discord.ClientException, discord.HTTPException) as e:
+                # They registered in this guild, a raw mention is still right for almost all
+                logger.warning(f"Could not fetch {len(missing) - start} uncached members of guild {guild.id}: {e}")
+                found.update(missing[start:])
+                break
+            returned = {member.id for member in fetched}
+            found.update(returned)
+            if self.mode == 'lean':
+                for user_id in chunk:
+                    self.remember(guild.id, user_id, user_id in returned)
+
+        return [user_id for user_id in user_ids if user_id in found]
+
+    def fields(self, mentions):
+        """mention lists joined into values of at most FIELD_CHARS, with their sizes"""
+        fields = []
+        current = []
+        size = 0
+        for mention in mentions:
+            extra = len(mention) + (1 if current else 0)
+            if current and size + extra > self.FIELD_CHARS:
+                fields.append((" ".join(current), len(current)))
+                current = []
+                extra = len(mention)
+                size = 0
+            current.append(mention)
+            size += extra
+        if current:
+            fields.append((" ".join(current), len(current)))
+        return fields
+
+    def new_embed(self, first, resource_count):
+        if not first:
+            return discord.Embed(color=discord.Color.blue())
+        if resource_count > 1:
+            description = f"These {resource_count} resources have been found to be relevant for you"
+        else:
+            description = "This resource has been found to be relevant for you"
+        return discord.Embed(title=self.TITLE, description=description, color=discord.Color.blue())
+
+    def build(self, mentions, resource_count=1, omitted=0):
+        """(lists of embeds, one list per message to send; how many mentions they hold)"""
+        messages = []
+        embeds = None
+        embed = None
+        message_chars = 0
+        shown = 0
+        for index, (value, count) in enumerate(self.fields(mentions)):
+            name = "Relevant for" if index == 0 else "Relevant for (continued)"
+            size = len(name) + len(value)
+            message_full = embeds is None or message_chars + size > self.MESSAGE_CHARS - self.RESERVED_CHARS or (
+                len(embed.fields) >= self.FIELDS_PER_EMBED and len(embeds) >= self.EMBEDS_PER_MESSAGE
+            )
+            if message_full:
+                if len(messages) == self.max_messages:
+                    break
+                embed = self.new_embed(not messages, resource_count)
+                embeds = [embed]
+                messages.append(embeds)
+                message_chars = len(embed)
+            elif len(embed.fields) >= self.FIELDS_PER_EMBED:
+                embed = self.new_embed(False, resource_count)
+                embeds.append(embed)
+            embed.add_field(name=name, value=value, inline=False)
+            message_chars += size
+            shown += count
+
+        if embed is not None:
+            hidden = omitted + len(mentions) - shown
+            footer = self.FOOTER if not hidden else f"{self.FOOTER} · {hidden} more matched"
+            embed.set_footer(text=footer)
+        return messages, shown
+
+    async def send(self, message, scores, resource_count=1):
+        """Reply to message with the ranked mentions of scores, returns the ids mentioned"""
+        ranked = self.rank(scores)
+        user_ids = await self.resolve(message.guild, ranked[:self.max_mentions])
+        if not user_ids:
+            return []
+        mentions = [f"<@{user_id}>" for user_id in user_ids]
+        messages, shown = self.build(mentions, resource_count, omitted=max(0, len(ranked) - self.max_mentions))
+        for embeds in messages:
+            await message.reply(embeds=embeds)
+        return user_ids[:shown]
+
+
+# Background resource jobs
+class ResourceJob:
+    """one message waiting for resource analysis"""
+    __slots__ = ('guild_id', 'message', 'enqueued_at', 'job_id')
+
+    def __init__(self, guild_id, message, job_id=None):
+        self.guild_id = guild_id
+        self.message = message
+        self.enqueued_at = time.monotonic()
+        self.job_id = job_id
+
+
+class ResourceJobQueue:
+    """In-process work queue between on_message and the analysis workers
+
+    Pending jobs are kept in one deque per guild and served round-robin, so
+    a burst in one guild can't starve the others. When the queue is full the
+    policy either drops the oldest job of the busiest guild ('drop_oldest')
+    or refuses the new one ('reject'). With a db_manager the jobs are also
+    written to the pending_jobs table so a restart can pick them up again.
+    """
+
+    POLICIES = ('drop_oldest', 'reject')
+
+    def __init__(self, handler, workers=None, max_size=None, policy=None, db_manager=None):
+        self.handler = handler
+        self.workers = workers or Config.JOB_WORKERS
+        self.max_size = max_size or Config.JOB_QUEUE_SIZE
+        self.policy = policy or Config.JOB_QUEUE_POLICY
+        if self.policy not in self.POLICIES:
+            raise ValueError(f"unknown queue policy {self.policy!r}")
+        self.db_manager = db_manager
+
+        self._guilds = OrderedDict()  # guild_id -> deque of ResourceJob
+        self._size = 0
+        self._cond = None
+        self._tasks = []
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def __len__(self):
+        return self._size
+
+    def start(self):
+        self._cond = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        """queue depth and latency figures"""
+        return {
+            'depth': self._size,
+            'guilds': len(self._guilds),
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'avg_wait_seconds': self.wait_seconds_total / max(self.processed + self.failed, 1),
+            'max_wait_seconds': self.wait_seconds_max,
+        }
+
+    async def put(self, message, job_id=None):
+        """Queue a message, returns False if the reject policy refused it"""
+        guild_id = message.guild.id if message.guild else None
+        if self._size >= self.max_size and self.policy == 'reject':
+            self.rejected += 1
+            return False
+
+        if job_id is None and self.db_manager is not None:
+            job_id = await self.db_manager.add_pending_job(guild_id, message.channel.id, message.id)
+        job = ResourceJob(guild_id, message, job_id)
+
+        async with self._cond:
+            if self._size >= self.max_size:
+                await self._drop_oldest()
+            self._guilds.setdefault(guild_id, deque()).append(job)
+            self._size += 1
+            self.enqueued += 1
+            self._cond.notify()
+        return True
+
+    async def _drop_oldest(self):
+        busiest = max(self._guilds, key=lambda guild_id: len(self._guilds[guild_id]))
+        jobs = self._guilds[busiest]
+        job = jobs.popleft()
+        if not jobs:
+            del self._guilds[busiest]
+        self._size -= 1
+        self.dropped += 1
+        logger.warning(f"Resource queue full, dropped a job from guild {busiest}")
+        await self._forget(job)
+
+    def _pop_fair(self):
+        guild_id, jobs = self._guilds.popitem(last=False)
+        job = jobs.popleft()
+        if jobs:
+            # Back of the line until every other guild got a turn
+            self._guilds[guild_id] = jobs
+        self._size -= 1
+        return job
+
+    async def _forget(self, job):
+        if job.job_id is not None and self.db_manager is not None:
+            await self.db_manager.delete_pending_job(job.job_id)
+
+    async def _worker(self):
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: self._size > 0)
+                job = self._pop_fair()
+
+            waited = time.monotonic() - job.enqueued_at
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            try:
+                await self.handler(job.message)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error processing resource job for message {job.message.id}: {e}")
+            await self._forget(job)
+
+
 # Main Bot Class
-class ResourceBot(commands.Bot):
+# AutoShardedBot when the shards are split across processes (or asked for)
+BotBase = commands.AutoShardedBot if Config.SHARDED else commands.Bot
+
+
+class ResourceBot(BotBase):
     def __init__(self):
         intents = discord.Intents.default()
         intents.message_content = True
         intents.members = True
+
+        options = {}
+        if Config.MEMBER_CACHE != 'full':
+            # Only the few tagged members are ever looked up, so don't chunk
+            # and hold every member of every guild for them
+            options = dict(member_cache_flags=discord.MemberCacheFlags.none(), chunk_guilds_at_startup=False)
         
-        super().__init__(command_prefix='!', intents=intents)
+        super().__init__(command_prefix='!', intents=intents, **options)
         self.db_manager = DatabaseManager()
-        self.analyzer = ResourceAnalyzer()
+        self.analyzer = ResourceAnalyzer(cache=ResultCache(self.db_manager))
+        self.resource_semaphore = asyncio.Semaphore(Config.MAX_CONCURRENT_RESOURCES)
+
+        self.embedding_matcher = None
+        if Config.MATCH_MODE == 'embedding':
+            if Config.EMBEDDING_BACKEND == 'local':
+                embedder = LocalEmbedder()
+            else:
+                embedder = OpenAIEmbedder(ResourceAnalyzer.client)
+            self.embedding_matcher = EmbeddingMatcher(self.db_manager, embedder)
+            self.db_manager.profile_listeners.append(self.embedding_matcher.on_profile_saved)
+            self.db_manager.change_listeners.append(self.embedding_matcher.on_guild_changed)
+        self.job_queue = ResourceJobQueue(
+            self.check_for_resources,
+            db_manager=self.db_manager if Config.PERSIST_JOBS else None
+        )
+        self.mention_renderer = MentionRenderer()
+        for command in APP_COMMANDS:
+            self.tree.add_command(command)
+        self.tree.error(on_app_command_error)
+        self.change_poller = None
+        self.recorder = ResourceRecorder(self.db_manager) if Config.RESOURCE_HISTORY else None
+        METRICS.add_collector(self.collect_metrics)
+        self.metrics_server = MetricsServer(METRICS) if Config.METRICS_PORT else None
     
     async def setup_hook(self):
+        await self.analyzer.start()
+        self.job_queue.start()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        if self.db_manager.change_log:
+            self.change_poller = asyncio.create_task(self.poll_changes())
+        if self.recorder is not None:
+            self.recorder.start()
+        if Config.PERSIST_JOBS:
+            asyncio.create_task(self.restore_pending_jobs())
+        await self.sync_commands()
+
+    def command_tree_hash(self):
+        """hash of the global slash command payloads, as tree.sync() would send them"""
+        payload = []
+        for command in self.tree.get_commands():
+            try:
+                # discord.py 2.3 (as pinned), tree.sync() sends command.to_dict()
+                payload.append(command.to_dict())
+            except TypeError:
+                # Later versions need the tree for localisation
+                payload.append(command.to_dict(self.tree))
+        payload.sort(key=lambda command: (command.get('type', 1), command['name']))
+        data = json.dumps([self.application_id, payload], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    async def sync_commands(self):
+        """Sync the command tree only when it differs from the last synced one
+
+        tree.sync() is a rate limited global REST call, so restarts skip it
+        while the stored hash still matches. With several shard processes only
+        the one running shard 0 syncs.
+        """
+        shard_ids = getattr(self, 'shard_ids', None)
+        if shard_ids and 0 not in shard_ids:
+            return
+        tree_hash = self.command_tree_hash()
+        if not Config.FORCE_COMMAND_SYNC and await self.db_manager.get_meta('command_tree_hash') == tree_hash:
+            logger.info("Slash commands unchanged, skipping sync")
+            return
         await self.tree.sync()
+        await self.db_manager.set_meta('command_tree_hash', tree_hash)
         logger.info("Slash commands synced")
-    
+
+    async def close(self):
+        if self.change_poller is not None:
+            self.change_poller.cancel()
+        await self.job_queue.stop()
+        if self.recorder is not None:
+            await self.recorder.stop()
+        await super().close()
+        await self.analyzer.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        self.db_manager.close()
+
+    def collect_metrics(self):
+        """counters kept by the cache, prefilter, queue and LLM gateway"""
+        cache = self.analyzer.cache
+        gateway = ResourceAnalyzer.client
+        queue_stats = self.job_queue.stats()
+        families = [
+            ('ozo_cache_lookups_total', 'counter', 'Result cache lookups', [
+                ({'result': 'hit'}, cache.hits), ({'result': 'miss'}, cache.misses),
+            ]),
+            ('ozo_prefilter_total', 'counter', 'Local prefilter decisions', [
+                ({'outcome': outcome}, count) for outcome, count in self.analyzer.prefilter_stats.items()
+            ]),
+            ('ozo_queue_depth', 'gauge', 'Resource jobs waiting', [({}, queue_stats['depth'])]),
+            ('ozo_queue_jobs_total', 'counter', 'Resource jobs by outcome', [
+                ({'outcome': outcome}, queue_stats[outcome])
+                for outcome in ('enqueued', 'processed', 'failed', 'dropped', 'rejected')
+            ]),
+            ('ozo_queue_max_wait_seconds', 'gauge', 'Longest time a job waited', [
+                ({}, queue_stats['max_wait_seconds'])
+            ]),
+            ('ozo_llm_retries_total', 'counter', 'Retried LLM calls', [({}, gateway.retries)]),
+            ('ozo_llm_rejected_total', 'counter', 'LLM calls refused by the open breaker', [({}, gateway.rejected)]),
+            ('ozo_llm_breaker_open', 'gauge', '1 while the LLM circuit breaker is not closed', [
+                ({}, int(gateway.breaker.state != 'closed'))
+            ]),
+        ]
+        batcher = self.analyzer.batcher
+        if batcher is not None:
+            families.append(('ozo_llm_batches_total', 'counter', 'Batched LLM requests sent', [({}, batcher.batches)]))
+            families.append(('ozo_llm_batch_items_total', 'counter', 'Resources sent in batches', [({}, batcher.items)]))
+        return families
+
+    async def on_member_join(self, member):
+        self.mention_renderer.forget(member.guild.id, member.id)
+
+    async def on_raw_member_remove(self, payload):
+        self.mention_renderer.forget(payload.guild_id, payload.user.id)
+
     async def on_ready(self):
         logger.info(f'{self.user} has connected to Discord!')
+
+    async def poll_changes(self):
+        """Keep the in-memory indexes in step with the other shard processes"""
+        while True:
+            await asyncio.sleep(Config.CHANGE_POLL_SECONDS)
+            try:
+                changes = await self.db_manager.poll_changes()
+                if changes:
+                    logger.info(f"Applied {len(changes)} changes from other processes")
+            except Exception as e:
+                logger.error(f"Error polling the change log: {e}")
+
+    def owns_guild(self, guild_id):
+        """whether guild_id is served by the shards of this process"""
+        shard_ids = getattr(self, 'shard_ids', None)
+        if not shard_ids or guild_id is None:
+            return True
+        return (guild_id >> 22) % self.shard_count in shard_ids
+
+    async def restore_pending_jobs(self):
+        """Re-queue the jobs a previous run left in the pending_jobs table"""
+        await self.wait_until_ready()
+        for job in await self.db_manager.get_pending_jobs():
+            if not self.owns_guild(job['server_id']):
+                # Left for the process running that guild's shard
+                continue
+            try:
+                channel = self.get_channel(job['channel_id']) or await self.fetch_channel(job['channel_id'])
+                message = await channel.fetch_message(job['message_id'])
+            except discord.HTTPException as e:
+                logger.warning(f"Dropping pending job {job['id']}: {e}")
+                await self.db_manager.delete_pending_job(job['id'])
+                continue
+
+            if not await self.job_queue.put(message, job_id=job['id']):
+                await self.db_manager.delete_pending_job(job['id'])
     
     async def on_message(self, message):
         # Ignore bot messages
         if message.author.bot:
             return
         
-        # Check for resources in messages
-        await self.check_for_resources(message)
+        # Only messages in a guild with something to analyze are queued, the
+        # check runs on in-memory rules without touching the database
+        if message.guild is not None and self.db_manager.routing_for(message.guild.id).resources(message):
+            # Queue the message for resource analysis, the workers tag users later
+            await self.job_queue.put(message)
         
         await self.process_commands(message)
     
+    async def match_resource(self, kind, resource, guild_id, vocabulary):
+        """{discord_id: score} of the users one url/attachment is relevant for"""
+        if self.embedding_matcher is not None:
+            if kind == 'url':
+                text = await self.analyzer.get_web_content(resource)
+            else:
+                text = await self.analyzer.attachment_text(resource)
+            if not text:
+                return {}
+            try:
+                return await self.embedding_matcher.match(guild_id, text)
+            except CircuitOpenError:
+                # Embedding API unavailable, fall back to local keyword matching
+                keywords = await self.analyzer.local_keywords(text, vocabulary)
+                skill_index = await self.db_manager.ensure_skill_index(guild_id)
+                return await self.analyzer.match_users_to_resource(skill_index, guild_id, keywords)
+
+        if kind == 'url':
+            keywords = await self.analyzer.analyze_url(resource, vocabulary)
+        else:
+            keywords = await self.analyzer.analyze_attachment(resource, vocabulary)
+        note_resource(keywords=list(keywords))
+        if not keywords:
+            return {}
+        skill_index = await self.db_manager.ensure_skill_index(guild_id)
+        return await self.analyzer.match_users_to_resource(skill_index, guild_id, keywords)
+
+    async def analyze_resource(self, kind, resource, guild_id, vocabulary, message_semaphore):
+        """Match one url/attachment within the concurrency limits
+
+        Never raises: a slow or failing resource yields no matches so the
+        other resources of the same message still get their results.
+        Returns (matches, history record of the resource).
+        """
+        name = resource if kind == 'url' else resource.filename
+        record = {
+            'kind': kind, 'name': name, 'resource_key': None,
+            'keywords': None, 'cache_hit': False, 'timings': {},
+        }
+        current_resource.set(record)
+        async with message_semaphore, self.resource_semaphore:
+            try:
+                matches = await asyncio.wait_for(
+                    self.match_resource(kind, resource, guild_id, vocabulary),
+                    timeout=Config.RESOURCE_TIMEOUT_SECONDS
+                )
+                RESOURCE_OUTCOMES.inc(kind=kind, outcome='matched' if matches else 'unmatched')
+                return matches, record
+            except asyncio.TimeoutError:
+                logger.warning(f"Timed out analyzing {kind} {name}")
+                RESOURCE_OUTCOMES.inc(kind=kind, outcome='timeout')
+            except Exception as e:
+                logger.error(f"Error analyzing {kind} {name}: {e}")
+                RESOURCE_OUTCOMES.inc(kind=kind, outcome='error')
+        return {}, record
+
     async def check_for_resources(self, message):
         """Check message for resources and tag relevant users"""
-        resource_found = False
-        master_keyword = self.db_manager.get_skills(message.guild.id)
+        if message.guild is None:
+            return
+        current_guild.set(message.guild.id)
+        with timed_stage('message'):
+            await self._check_for_resources(message)
 
-        
-        # Check for links
-        url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-        urls = re.findall(url_pattern, message.content)
-        keyword_list = []
-        print(f"----> master key word {master_keyword}")
-        
-        if urls:
-            for url in urls: 
-                keyword_list = await self.analyzer.get_web_content(url, master_keyword )
-                print(f"---->url {keyword_list}")
-    
-        # Check for document attachments
-        if not resource_found and message.attachments:
-            for attachment in message.attachments:
-                if attachment.filename.lower().endswith(('.pdf', '.docx', '.doc', '.txt', '.md')):
-                    text = await self.analyzer.extract_text_from_document(attachment)
-                    # print(f"---> doc text is {text}")
-                    if text:
-                        doc_keyword = self.analyzer.check_document_similarity(text, master_keyword)
-                        print(f"-----> this is the doc after the LLM {doc_keyword}")
-                        keyword_list.append(doc_keyword) # type: ignore
-        
-        if len(keyword_list) != 0 :
-            resource_found = True
+    async def _check_for_resources(self, message):
+        # Collect every url and document the guild's routing rules allow,
+        # then analyze them all at once
+        resources = self.db_manager.routing_for(message.guild.id).resources(message)
+        if not resources:
+            return
+        vocabulary = await self.db_manager.get_vocabulary(message.guild.id)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"guild={message.guild.id} message={message.id} resources={len(resources)} vocabulary_terms={len(vocabulary.terms)}")
 
-        print(f"HHFBSBBFSDBFSBB FSUBBFBEBF {keyword_list}")
-    
+        message_semaphore = asyncio.Semaphore(Config.MAX_RESOURCES_PER_MESSAGE)
+        results = await asyncio.gather(*(
+            self.analyze_resource(kind, resource, message.guild.id, vocabulary, message_semaphore)
+            for kind, resource in resources
+        ))
+        scores = {}
+        for matches, _ in results:
+            for user_id, score in matches.items():
+                scores[user_id] = scores.get(user_id, 0) + score
         
-        # If resource found, match and tag users
-        if resource_found:
-            users = self.db_manager.get_all_users(message.guild.id)
-            print(f"users are here {users}")
-            if users:
-                matched_user_ids = await self.analyzer.match_users_to_resource(
-                     users, keyword_list
+        # If resource found, tag the matched users
+        if scores:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"guild={message.guild.id} message={message.id} matched_users={len(scores)}")
+
+            with timed_stage('reply'):
+                tagged = await self.mention_renderer.send(message, scores, resource_count=len(resources))
+        else:
+            tagged = []
+
+        if self.recorder is not None:
+            tagged = set(tagged)
+            for matches, record in results:
+                self.recorder.record(
+                    message.guild.id, message.id, record,
+                    sorted(user_id for user_id in matches if user_id in tagged)
                 )
-                print(f"matched users are {matched_user_ids}")
-                matched_user_ids = list(set(matched_user_ids))
-                if matched_user_ids:
-                    # Create mention string
-                    mentions = []
-                    for user_id in matched_user_ids:  # Limit to 10 tags
-                        member = message.guild.get_member(int(user_id))
-                        if member:
-                            mentions.append(member.mention)
-                    
-                    if mentions:
-                        embed = discord.Embed(
-                            title="📚 Relevant Resource Detected",
-                            description=f"This resource has been found to be relevant for you",
-                            color=discord.Color.blue()
-                        )
-                        embed.add_field(
-                            name="Relevant for",
-                            value=" ".join(mentions),
-                            inline=False
-                        )
-                        embed.set_footer(text="This resource matches your profile interests/skills")
-                        print
-                        
-                        await message.reply(embed=embed)
 
 
 
 # Bot Commands
-bot = ResourceBot()
+# Built by run_shards(), not at import: spawned worker processes (the
+# document pool, the shard processes) re-run this module's top level
+bot = None
 
-@bot.tree.command(name="register", description="Register or update your profile")
+@app_commands.command(name="register", description="Register or update your profile")
 async def register(interaction: discord.Interaction):
-    modal = RegistrationModal(bot.db_manager)
+    modal = RegistrationModal(interaction.client.db_manager)
     await interaction.response.send_modal(modal)
 
-@bot.tree.command(name="profile", description="View your profile")
+@app_commands.command(name="profile", description="View your profile")
 async def profile(interaction: discord.Interaction):
-    user = bot.db_manager.get_user(interaction.user.id, interaction.guild_id)
+    user = await interaction.client.db_manager.get_user(interaction.user.id, interaction.guild_id)
     
     if not user:
         await interaction.response.send_message(
@@ -540,9 +3416,9 @@ async def profile(interaction: discord.Interaction):
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
-@bot.tree.command(name="edit_profile", description="Edit your existing profile")
+@app_commands.command(name="edit_profile", description="Edit your existing profile")
 async def edit_profile(interaction: discord.Interaction):
-    user = bot.db_manager.get_user(interaction.user.id, interaction.guild_id)
+    user = await interaction.client.db_manager.get_user(interaction.user.id, interaction.guild_id)
     
     if not user:
         await interaction.response.send_message(
@@ -552,17 +3428,17 @@ async def edit_profile(interaction: discord.Interaction):
         return
     
     # Create modal with existing data
-    modal = RegistrationModal(bot.db_manager)
+    modal = RegistrationModal(interaction.client.db_manager)
     modal.job_title.default = user['job_title']
     modal.skills.default = user['skills']
     modal.interests.default = user['interests']
     
     await interaction.response.send_modal(modal)
 
-@bot.tree.command(name="set_theme", description="Set the server's theme (Admin only)")
+@app_commands.command(name="set_theme", description="Set the server's theme (Admin only)")
 @app_commands.checks.has_permissions(administrator=True)
 async def set_theme(interaction: discord.Interaction, theme: str):
-    bot.db_manager.save_server_theme(interaction.guild_id, theme)
+    await interaction.client.db_manager.save_server_theme(interaction.guild_id, theme)
     
     embed = discord.Embed(
         title="✅ Theme Updated",
@@ -572,37 +3448,266 @@ async def set_theme(interaction: discord.Interaction, theme: str):
     
     await interaction.response.send_message(embed=embed)
 
-@bot.tree.command(name="stats", description="View bot statistics for this server")
+@app_commands.command(name="import_profiles", description="Import member profiles from a CSV or JSON file (Admin only)")
+@app_commands.describe(file="CSV with discord_id, discord_username, job_title, skills, interests columns, or JSON/JSON lines records")
+@app_commands.checks.has_permissions(administrator=True)
+async def import_profiles(interaction: discord.Interaction, file: discord.Attachment):
+    if file.size > Config.MAX_IMPORT_BYTES:
+        await interaction.response.send_message(
+            f"❌ The file is too large, the limit is {Config.MAX_IMPORT_BYTES // (1024 * 1024)} MB.",
+            ephemeral=True
+        )
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    started = time.perf_counter()
+    try:
+        data = await file.read()
+        # Membership is only known up front with the full, chunked member cache
+        guild = interaction.guild
+        member_ids = {member.id for member in guild.members} if guild.chunked else None
+        imported, skipped = await interaction.client.db_manager.import_users(interaction.guild_id, file.filename, data, member_ids)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        await interaction.followup.send(f"❌ Could not import {file.filename}: {e}", ephemeral=True)
+        return
+    except sqlite3.Error as e:
+        # e.g. "database is locked" while another import holds the write lock
+        logger.error(f"Error importing profiles for server {interaction.guild_id}: {e}")
+        await interaction.followup.send("❌ The database is busy, nothing was imported. Please try again.", ephemeral=True)
+        return
+
+    embed = discord.Embed(
+        title="✅ Profiles Imported",
+        description=f"Imported **{imported}** profiles in {time.perf_counter() - started:.1f}s",
+        color=discord.Color.green()
+    )
+    reasons = {
+        'invalid': "without a valid discord_id",
+        'other_server': "of users registered in another server",
+        'not_member': "of users who are not members of this server",
+    }
+    for reason, count in skipped.items():
+        if count:
+            embed.add_field(name="Skipped", value=f"{count} records {reasons[reason]}", inline=False)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@app_commands.command(name="export_profiles", description="Export this server's member profiles (Admin only)")
+@app_commands.choices(file_format=[
+    app_commands.Choice(name="csv", value="csv"),
+    app_commands.Choice(name="json lines", value="jsonl"),
+])
+@app_commands.checks.has_permissions(administrator=True)
+async def export_profiles(interaction: discord.Interaction, file_format: Optional[app_commands.Choice[str]] = None):
+    extension = file_format.value if file_format else 'csv'
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    data = await interaction.client.db_manager.export_users(interaction.guild_id, extension)
+    if len(data) > interaction.guild.filesize_limit:
+        await interaction.followup.send(
+            f"❌ The export is {len(data) // (1024 * 1024)} MB, over this server's "
+            f"{interaction.guild.filesize_limit // (1024 * 1024)} MB upload limit.",
+            ephemeral=True
+        )
+        return
+    await interaction.followup.send(
+        "📤 Member profiles of this server",
+        file=discord.File(io.BytesIO(data), filename=f"profiles-{interaction.guild_id}.{extension}"),
+        ephemeral=True
+    )
+
+@app_commands.command(name="routing", description="Choose which messages the bot analyzes (Admin only)")
+@app_commands.describe(
+    channel="Channel to watch, ignore or reset",
+    channel_mode="watch: only watched channels are analyzed, ignore: never analyzed, default: remove the rule",
+    attachment_types="Comma separated file types to analyze, e.g. pdf,docx",
+    min_urls="Minimum number of links a message needs for its links to be analyzed",
+    max_urls="Maximum number of links analyzed per message (0 turns link analysis off)",
+    reset="Restore the default rules"
+)
+@app_commands.choices(channel_mode=[
+    app_commands.Choice(name="watch", value="watch"),
+    app_commands.Choice(name="ignore", value="ignore"),
+    app_commands.Choice(name="default", value="default"),
+])
+@app_commands.checks.has_permissions(administrator=True)
+async def routing(
+    interaction: discord.Interaction,
+    channel: Optional[discord.TextChannel] = None,
+    channel_mode: Optional[app_commands.Choice[str]] = None,
+    attachment_types: Optional[str] = None,
+    min_urls: Optional[app_commands.Range[int, 0, 50]] = None,
+    max_urls: Optional[app_commands.Range[int, 0, 50]] = None,
+    reset: bool = False
+):
+    current = interaction.client.db_manager.routing_for(interaction.guild_id)
+    changed = reset or any(value is not None for value in (channel_mode, attachment_types, min_urls, max_urls))
+    if channel_mode is not None and channel is None:
+        await interaction.response.send_message("❌ Pick a channel for the channel mode.", ephemeral=True)
+        return
+
+    if reset:
+        rules = None
+        current = interaction.client.db_manager.default_routing
+    elif changed:
+        watch = set(current.watch_channels)
+        ignore = set(current.ignore_channels)
+        if channel_mode is not None:
+            watch.discard(channel.id)
+            ignore.discard(channel.id)
+            if channel_mode.value == 'watch':
+                watch.add(channel.id)
+            elif channel_mode.value == 'ignore':
+                ignore.add(channel.id)
+        types = current.attachment_types
+        if attachment_types is not None:
+            types = tuple(
+                f".{part.strip().lower().lstrip('.')}" for part in attachment_types.split(',') if part.strip()
+            )
+        rules = current = RoutingRules(
+            watch, ignore, types,
+            min_urls if min_urls is not None else current.min_urls,
+            max_urls if max_urls is not None else current.max_urls
+        )
+    if changed:
+        await interaction.client.db_manager.save_routing(interaction.guild_id, rules)
+
+    def channel_list(channel_ids):
+        return " ".join(f"<#{channel_id}>" for channel_id in sorted(channel_ids)) or "—"
+
+    embed = discord.Embed(
+        title="✅ Routing Updated" if changed else "🔀 Routing Rules",
+        color=discord.Color.green() if changed else discord.Color.blue()
+    )
+    embed.add_field(name="Watched Channels", value=channel_list(current.watch_channels) if current.watch_channels else "All", inline=False)
+    embed.add_field(name="Ignored Channels", value=channel_list(current.ignore_channels), inline=False)
+    embed.add_field(name="Attachment Types", value=", ".join(current.attachment_types) or "None", inline=False)
+    embed.add_field(name="Links per Message", value=f"{current.min_urls} to {current.max_urls}", inline=False)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@app_commands.command(name="stats", description="View bot statistics for this server")
 async def stats(interaction: discord.Interaction):
-    users = bot.db_manager.get_all_users(interaction.guild_id)
-    theme = bot.db_manager.get_server_theme(interaction.guild_id)
+    server_stats = await interaction.client.db_manager.get_server_stats(interaction.guild_id)
     
     embed = discord.Embed(
         title="📊 Server Statistics",
         color=discord.Color.blue()
     )
-    embed.add_field(name="Registered Users", value=len(users), inline=True)
-    embed.add_field(name="Server Theme", value=theme, inline=False)
+    embed.add_field(name="Registered Users", value=server_stats['users'], inline=True)
+    embed.add_field(name="Server Theme", value=server_stats['theme'], inline=False)
+    embed.add_field(
+        name=f"Resources Analyzed ({Config.STATS_WINDOW_DAYS} days)", value=server_stats['resources'], inline=True
+    )
+    embed.add_field(name="Tags Sent", value=server_stats['tags'], inline=True)
+    embed.add_field(name="Cache Hit Rate", value=f"{server_stats['cache_hit_rate']:.0%}", inline=True)
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 # Error Handler
-@bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
     if isinstance(error, app_commands.MissingPermissions):
-        await interaction.response.send_message(
-            "❌ You don't have permission to use this command.",
-            ephemeral=True
-        )
+        message = "❌ You don't have permission to use this command."
     else:
         logger.error(f"Error: {error}")
-        await interaction.response.send_message(
-            "❌ An error occurred while processing your command.",
-            ephemeral=True
-        )
+        message = "❌ An error occurred while processing your command."
+    # Deferred commands (import/export) can only answer through a followup
+    if interaction.response.is_done():
+        await interaction.followup.send(message, ephemeral=True)
+    else:
+        await interaction.response.send_message(message, ephemeral=True)
+
 
+APP_COMMANDS = (register, profile, edit_profile, set_theme, import_profiles, export_profiles, routing, stats)
 
 
 # Run the bot
+def run_shards(shard_ids=None, shard_count=None, process_index=0):
+    """Run the bot in this process, for some shards or all of them"""
+    global bot
+    bot = ResourceBot()
+    if shard_ids is not None:
+        bot.shard_ids = list(shard_ids)
+    if shard_count is not None:
+        bot.shard_count = shard_count
+    if bot.metrics_server is not None:
+        # Every process on the host needs its own port
+        bot.metrics_server.port += process_index
+    bot.run(Config.DISCORD_TOKEN)
+
+
+def launch():
+    """Entry point: one bot process, or SHARD_PROCESSES processes splitting the shards
+
+    The shard range is cut into contiguous slices, one per worker process.
+    Workers share the SQLite (WAL) database and keep their own in-memory
+    indexes and caches, invalidated through the change_log table. A worker
+    that crashes is started again after an exponential backoff, unless it
+    keeps dying right after starting (a bad token, a startup error), in
+    which case it is given up on and launch() exits with status 1.
+    """
+    if Config.SHARD_PROCESSES <= 1:
+        run_shards(shard_count=Config.SHARD_COUNT)
+        return
+
+    shard_count = Config.SHARD_COUNT or Config.SHARD_PROCESSES
+    processes = min(Config.SHARD_PROCESSES, shard_count)
+    slices = [list(range(shard_count))[index * shard_count // processes:(index + 1) * shard_count // processes]
+              for index in range(processes)]
+    context = multiprocessing.get_context('spawn')
+    workers = {}      # index -> (process, start time)
+    failures = {}     # index -> crashes in a row soon after starting
+    restarts = {}     # index -> time of the scheduled restart
+    gave_up = []
+
+    def start(index):
+        worker = context.Process(
+            target=run_shards, args=(slices[index], shard_count, index), name=f"ozo-shards-{index}"
+        )
+        worker.start()
+        workers[index] = (worker, time.monotonic())
+        logger.info(f"Started process {worker.pid} for shards {slices[index]} of {shard_count}")
+
+    for index in range(processes):
+        start(index)
+    try:
+        while workers or restarts:
+            time.sleep(1)
+            now = time.monotonic()
+            for index, (worker, started) in list(workers.items()):
+                if worker.is_alive():
+                    continue
+                del workers[index]
+                if worker.exitcode == 0:
+                    continue
+                uptime = now - started
+                failures[index] = failures.get(index, 0) + 1 if uptime < Config.SHARD_FAST_FAILURE_SECONDS else 1
+                if failures[index] >= Config.SHARD_MAX_FAST_FAILURES:
+                    logger.error(
+                        f"Shard process {index} failed {failures[index]} times in a row right after starting, "
+                        f"giving up on shards {slices[index]}"
+                    )
+                    gave_up.append(index)
+                    continue
+                delay = min(
+                    Config.SHARD_RESTART_MAX_SECONDS,
+                    Config.SHARD_RESTART_BASE_SECONDS * 2 ** (failures[index] - 1)
+                )
+                logger.warning(
+                    f"Shard process {index} exited with {worker.exitcode} after {uptime:.0f}s, restarting in {delay:.0f}s"
+                )
+                restarts[index] = now + delay
+            for index, restart_at in list(restarts.items()):
+                if restart_at <= now:
+                    del restarts[index]
+                    start(index)
+    except KeyboardInterrupt:
+        for worker, _ in workers.values():
+            worker.terminate()
+        for worker, _ in workers.values():
+            worker.join()
+        return
+    if gave_up:
+        raise SystemExit(1)
+
+
 if __name__ == "__main__":
-    bot.run(Config.DISCORD_TOKEN)
\ No newline at end of file
+    launch()
\ No newline at end of file